@@ -17,14 +17,34 @@ Be careful: this operates against Stripe test API only. Do NOT use live keys.
 """
 
 import os
+import re
+import json
 import time
 import random
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
+import requests
 import stripe
 import os
 
+# Resolve the TestClock resource once; older SDKs expose it as test_helpers.test_clock
+try:
+    TestClock = stripe.test_helpers.TestClock
+except AttributeError:
+    TestClock = stripe.test_helpers.test_clock
+
+# KEY=value lines of a .env file; the value may be wrapped in single or double quotes
+DOTENV_RE = re.compile(r'''^[ \t]*([A-Za-z_]\w*)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|([^\n]*?))[ \t]*\r?$''', re.M)
+
+# Every object this script creates is tagged metadata={'run': RUN_TAG, 'run_id': ...} so cleanup
+# can find them with a metadata search instead of scanning the account
+RUN_TAG = 'billing_hist'
+RUN_QUERY = f'metadata["run"]:"{RUN_TAG}"'
+
 # Config defaults
 DEFAULT_CUSTOMER_COUNT = 60
 DEFAULT_MONTHS = 6
@@ -49,88 +69,286 @@ PAYMENT_CARD_DECLINE = {
     }
 }
 
-SLEEP_BETWEEN_CALLS = 0.12
+
+class AIMDLimiter:
+    """Caps in-flight Stripe requests with an additive-increase / multiplicative-decrease window.
+
+    Each success grows the window by `alpha / limit` (about +alpha per full window of requests);
+    each 429/5xx multiplies it by `beta`. Callers block in acquire() while the window is full.
+    """
+
+    def __init__(self, initial=4.0, min_limit=1.0, max_limit=64.0, alpha=0.5, beta=0.5):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.alpha = alpha
+        self.beta = beta
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.beta)
+            else:
+                self.limit = min(self.max_limit, self.limit + self.alpha / self.limit)
+            self._cond.notify_all()
+
+
+LIMITER = AIMDLimiter()
+CALL_MAX_ATTEMPTS = 5
+# SDK methods that only read, so replaying them after a 5xx or a lost response is harmless
+READ_METHODS = {'retrieve', 'list', 'search'}
+
+# Recent advance -> 'ready' latencies (seconds); seeds the first poll delay of the next advance
+READY_LATENCIES = deque(maxlen=32)
+POLL_MIN_DELAY = 0.1
+POLL_MAX_DELAY = 2.0
+
+# Max concurrent Invoice.pay calls for a single customer's open invoices
+PAY_CONCURRENCY = 4
+
+# Worker threads only block on HTTP, so a small stack lets --concurrency scale to hundreds of
+# workers without reserving the default ~8 MB of address space per thread
+WORKER_STACK_SIZE = 512 * 1024
+
+
+def _is_throttle(e):
+    if isinstance(e, stripe.error.RateLimitError):
+        return True
+    status = getattr(e, 'http_status', None)
+    return isinstance(e, stripe.error.StripeError) and status is not None and status >= 500
+
+
+def _is_retryable(e, fn, kwargs):
+    """Whether replaying this failed call is safe.
+
+    429s were rejected before running, so they always are. A 5xx may have been applied
+    already, so it is only replayed for reads (or when Stripe says Stripe-Should-Retry: true).
+    A connection error (the response was lost) is replayed for reads and for writes that carry
+    an idempotency_key, where Stripe returns the original result if the first attempt went through.
+    """
+    headers = getattr(e, 'headers', None) or {}
+    should_retry = headers.get('Stripe-Should-Retry')
+    if should_retry == 'false':
+        return False
+    if isinstance(e, stripe.error.RateLimitError) or should_retry == 'true':
+        return True
+    is_read = getattr(fn, '__name__', '') in READ_METHODS
+    if isinstance(e, stripe.error.APIConnectionError):
+        return is_read or bool(kwargs.get('idempotency_key'))
+    return _is_throttle(e) and is_read
+
+
+def _retry_after(e):
+    headers = getattr(e, 'headers', None) or {}
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_sleep(e, base, prev, cap):
+    """Sleep before retrying a failed Stripe call and return the delay used.
+
+    Honors the server's Retry-After header (plus a little jitter) when present; otherwise uses
+    decorrelated jitter, uniform(base, prev * 3) capped at `cap`.
+    """
+    retry_after = _retry_after(e)
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, 0.25)
+    else:
+        delay = min(cap, random.uniform(base, prev * 3))
+    time.sleep(delay)
+    return delay
+
+
+def call(fn, *args, **kwargs):
+    """Invoke a Stripe SDK function through the shared AIMD limiter.
+
+    Rate-limited (429) and server (5xx) errors shrink the window; the ones that are safe to
+    replay (see _is_retryable) are retried a few times with a short backoff, everything else
+    is raised to the caller unchanged.
+    """
+    delay = 0.25
+    for attempt in range(CALL_MAX_ATTEMPTS):
+        LIMITER.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            LIMITER.release(throttled=_is_throttle(e))
+            if attempt == CALL_MAX_ATTEMPTS - 1 or not _is_retryable(e, fn, kwargs):
+                raise
+            delay = backoff_sleep(e, base=0.25, prev=delay, cap=4.0)
+            continue
+        LIMITER.release()
+        return result
+
+
+def _field(obj, name, default=None):
+    """Read `name` from a StripeObject attribute or dict key, whichever is set."""
+    v = getattr(obj, name, None)
+    if v is not None:
+        return v
+    return obj.get(name, default) if hasattr(obj, 'get') else default
+
+
+def configure_http_client(pool_maxsize):
+    """Route all Stripe calls through one pooled requests.Session so worker threads reuse
+    keep-alive TLS connections instead of opening a connection per thread."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=30, session=session)
 
 
 def ts(dt: datetime) -> int:
     return int(dt.timestamp())
 
 
-def create_test_clock(stripe_module, frozen_time, name):
-    try:
-        tc = stripe_module.test_helpers.TestClock.create(frozen_time=frozen_time, name=name)
-    except Exception:
-        tc = stripe_module.test_helpers.test_clock.create(frozen_time=frozen_time, name=name)
-    return tc
+def create_test_clock(stripe_module, frozen_time, name, idempotency_key=None):
+    return call(TestClock.create, frozen_time=frozen_time, name=name, idempotency_key=idempotency_key)
 
 
 def advance_test_clock(stripe_module, clock_id, frozen_time):
     # Retrieve current clock frozen_time and ensure new frozen_time is strictly greater
     try:
-        tc = stripe_module.test_helpers.TestClock.retrieve(clock_id)
-        cur = getattr(tc, 'frozen_time', None) or (tc.get('frozen_time') if hasattr(tc, 'get') else None)
+        tc = call(TestClock.retrieve, clock_id)
+        cur = _field(tc, 'frozen_time')
     except Exception:
         cur = None
 
     if cur is not None and frozen_time <= cur:
         frozen_time = cur + 1
 
-    # Try advancing with RateLimit backoff (a few attempts), then poll until TestClock is 'ready'
+    # Throttling is retried (and the window shrunk) inside call(); this loop covers the rest.
+    # A rejected advance usually means an earlier attempt went through after all (e.g. a 5xx
+    # that was applied), so re-read the clock instead of retrying: if it already reached (or is
+    # advancing to) the requested time the poll below confirms it, otherwise the error stands.
     max_advance_attempts = 8
     backoff = 0.5
     advanced = False
     for attempt in range(max_advance_attempts):
         try:
-            stripe_module.test_helpers.TestClock.advance(clock_id, frozen_time=frozen_time)
+            call(TestClock.advance, clock_id, frozen_time=frozen_time)
             advanced = True
             break
-        except stripe.error.RateLimitError:
-            time.sleep(backoff)
-            backoff = min(backoff * 1.5, 5.0)
-            continue
-        except Exception:
-            time.sleep(backoff)
-            backoff = min(backoff * 1.5, 5.0)
-            continue
+        except stripe.error.InvalidRequestError:
+            tc = call(TestClock.retrieve, clock_id)
+            cur = _field(tc, 'frozen_time')
+            if _field(tc, 'status') == 'advancing' or (cur is not None and cur >= frozen_time):
+                advanced = True
+                break
+            raise
+        except Exception as e:
+            backoff = backoff_sleep(e, base=0.5, prev=backoff, cap=5.0)
 
     if not advanced:
         raise RuntimeError(f'Failed to advance test clock {clock_id} after {max_advance_attempts} attempts')
 
-    # Poll until TestClock reports status 'ready' and frozen_time >= requested time
+    # Poll until TestClock reports status 'ready' and frozen_time >= requested time.
+    # The first wait is the moving average of recent ready latencies, then grows x1.5 up to 2s.
     timeout = 60
     start = time.time()
+    if READY_LATENCIES:
+        delay = sum(READY_LATENCIES) / len(READY_LATENCIES)
+    else:
+        delay = POLL_MIN_DELAY
+    delay = min(max(delay, POLL_MIN_DELAY), POLL_MAX_DELAY)
     while True:
+        time.sleep(delay)
         try:
-            tc2 = stripe_module.test_helpers.TestClock.retrieve(clock_id)
-            status = getattr(tc2, 'status', None) or (tc2.get('status') if hasattr(tc2, 'get') else None)
-            new_frozen = getattr(tc2, 'frozen_time', None) or (tc2.get('frozen_time') if hasattr(tc2, 'get') else None)
+            tc2 = call(TestClock.retrieve, clock_id)
+            status = _field(tc2, 'status')
+            new_frozen = _field(tc2, 'frozen_time')
             if status == 'ready' and (new_frozen is None or new_frozen >= frozen_time):
+                READY_LATENCIES.append(time.time() - start)
                 return tc2
         except Exception:
             pass
         if time.time() - start > timeout:
             raise TimeoutError(f'TestClock {clock_id} not ready after {timeout}s (requested frozen_time={frozen_time})')
-        time.sleep(1)
+        delay = min(delay * 1.5, POLL_MAX_DELAY)
+
+
+def _is_generated(obj):
+    metadata = _field(obj, 'metadata') or {}
+    return metadata.get('run') == RUN_TAG
+
+
+def iter_all(fn, **params):
+    """Iterate every object of a Stripe list or search endpoint with an explicit cursor
+    (starting_after for lists, next_page for search), so each page goes through call()."""
+    while True:
+        page = call(fn, **params)
+        data = _field(page, 'data') or []
+        yield from data
+        if not _field(page, 'has_more') or not data:
+            return
+        next_page = _field(page, 'next_page')
+        if next_page:
+            params = {**params, 'page': next_page}
+        else:
+            params = {**params, 'starting_after': data[-1]['id']}
+
+
+def search_or_list(resource, query, keep):
+    """Return objects matching a Stripe Search `query`, so only matches are paged over the wire.
+
+    Falls back to listing every object and filtering with `keep` when Search is unavailable
+    for the resource or account. Search results are drained up front so a rejection on any
+    page (not just the first) still falls back.
+    """
+    try:
+        return list(iter_all(resource.search, query=query, limit=100))
+    except (AttributeError, stripe.error.InvalidRequestError):
+        return (obj for obj in iter_all(resource.list, limit=100) if keep(obj))
+
+
+def has_pending_invoices(customer_id):
+    """Return True if the customer has any draft or open invoice (or if that can't be determined)."""
+    for status in ('draft', 'open'):
+        try:
+            if call(stripe.Invoice.list, customer=customer_id, status=status, limit=1).data:
+                return True
+        except Exception:
+            return True
+    return False
+
+
+def safe_pay(invoice_id, idempotency_key=None):
+    """Pay an invoice, returning True on success and False if Stripe rejected it."""
+    try:
+        call(stripe.Invoice.pay, invoice_id, idempotency_key=idempotency_key)
+        return True
+    except Exception:
+        return False
 
 
 def cancel_subscription_retry(sub_id, max_retries=20):
     backoff = 0.5
     for attempt in range(max_retries):
         try:
-            stripe.Subscription.delete(sub_id)
+            call(stripe.Subscription.delete, sub_id)
             return True
-        except stripe.error.RateLimitError:
-            time.sleep(backoff)
-            backoff = min(backoff * 1.5, 2.0)
+        except stripe.error.RateLimitError as e:
+            backoff = backoff_sleep(e, base=0.5, prev=backoff, cap=2.0)
             continue
         except Exception:
             # If delete fails for other reasons (e.g., transient), try scheduling cancellation at period end
             try:
-                stripe.Subscription.modify(sub_id, cancel_at_period_end=True)
+                call(stripe.Subscription.modify, sub_id, cancel_at_period_end=True)
                 return True
-            except Exception:
-                time.sleep(backoff)
-                backoff = min(backoff * 1.5, 2.0)
+            except Exception as e:
+                backoff = backoff_sleep(e, base=0.5, prev=backoff, cap=2.0)
                 continue
     return False
 
@@ -146,25 +364,20 @@ def main():
     parser.add_argument('--active-pct', type=float, default=80.0, help='Percent of customers that should be Active')
     parser.add_argument('--canceled-pct', type=float, default=20.0, help='Percent of customers that should be Canceled')
     parser.add_argument('--annual-pct', type=float, default=20.0, help='Percent of customers that should be annual (billed yearly)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of customers to simulate in parallel')
     args = parser.parse_args()
 
+    run_id = str(int(time.time()))
+    run_metadata = {'run': RUN_TAG, 'run_id': run_id}
+
     # Load .env if present so users can keep STRIPE_SECRET_KEY in repo root
     def _load_dotenv(path: str = ".env") -> None:
         if not os.path.exists(path):
             return
-        try:
-            with open(path, "r", encoding="utf-8") as fh:
-                for ln in fh:
-                    ln = ln.strip()
-                    if not ln or ln.startswith("#") or "=" not in ln:
-                        continue
-                    k, v = ln.split("=", 1)
-                    k = k.strip()
-                    v = v.strip().strip('"').strip("'")
-                    if k and k not in os.environ:
-                        os.environ[k] = v
-        except Exception:
-            pass
+        with open(path, "r", encoding="utf-8") as fh:
+            txt = fh.read()
+        for k, dq, sq, bare in DOTENV_RE.findall(txt):
+            os.environ.setdefault(k, dq or sq or bare)
 
     _load_dotenv()
 
@@ -174,6 +387,8 @@ def main():
         return
 
     stripe.api_key = stripe_key
+    # One connection per in-flight request the limiter can allow
+    configure_http_client(pool_maxsize=int(LIMITER.max_limit))
     random.seed(args.seed)
 
     # Validate percentages (active + canceled must sum to ~100)
@@ -184,36 +399,32 @@ def main():
 
     def do_cleanup():
         print('Cleanup: listing and removing previous test customers, subscriptions, test clocks, and products...')
-        # Delete customers matching our test email/name pattern
+        # Delete customers tagged by previous runs
         try:
-            for cust in stripe.Customer.list(limit=100).auto_paging_iter():
+            for cust in search_or_list(stripe.Customer, RUN_QUERY, keep=_is_generated):
                 try:
-                    if cust.email and cust.email.endswith('@actual.com') and (cust.email.startswith('active') or cust.email.startswith('cancel')):
-                        # delete subscriptions
-                        for sub in stripe.Subscription.list(customer=cust.id).auto_paging_iter():
-                            try:
-                                stripe.Subscription.delete(sub.id)
-                                time.sleep(SLEEP_BETWEEN_CALLS)
-                            except Exception:
-                                pass
+                    # delete subscriptions
+                    for sub in iter_all(stripe.Subscription.list, customer=cust.id):
                         try:
-                            stripe.Customer.delete(cust.id)
-                            time.sleep(SLEEP_BETWEEN_CALLS)
+                            call(stripe.Subscription.delete, sub.id)
                         except Exception:
                             pass
+                    try:
+                        call(stripe.Customer.delete, cust.id)
+                    except Exception:
+                        pass
                 except Exception:
                     pass
         except Exception:
             pass
 
-        # Delete test clocks with name prefix
+        # Delete test clocks with name prefix (test clocks have no Search API or metadata, so list them)
         try:
-            for tc in stripe.test_helpers.TestClock.list(limit=100).auto_paging_iter():
+            for tc in iter_all(TestClock.list, limit=100):
                 try:
                     if tc.name and tc.name.startswith('clock_'):
                         try:
-                            stripe.test_helpers.TestClock.delete(tc.id)
-                            time.sleep(SLEEP_BETWEEN_CALLS)
+                            call(TestClock.delete, tc.id)
                         except Exception:
                             pass
                 except Exception:
@@ -221,23 +432,20 @@ def main():
         except Exception:
             pass
 
-        # Delete product(s) created by previous runs
+        # Delete product(s) tagged by previous runs
         try:
-            for prod in stripe.Product.list(limit=100).auto_paging_iter():
+            for prod in search_or_list(stripe.Product, RUN_QUERY, keep=_is_generated):
                 try:
-                    if prod.name and prod.name.startswith('Test Product - Billing Historical'):
-                        # delete prices first
-                        for pr in stripe.Price.list(product=prod.id).auto_paging_iter():
-                            try:
-                                stripe.Price.delete(pr.id)
-                                time.sleep(SLEEP_BETWEEN_CALLS)
-                            except Exception:
-                                pass
+                    # delete prices first
+                    for pr in iter_all(stripe.Price.list, product=prod.id):
                         try:
-                            stripe.Product.delete(prod.id)
-                            time.sleep(SLEEP_BETWEEN_CALLS)
+                            call(stripe.Price.delete, pr.id)
                         except Exception:
                             pass
+                    try:
+                        call(stripe.Product.delete, prod.id)
+                    except Exception:
+                        pass
                 except Exception:
                     pass
         except Exception:
@@ -253,17 +461,16 @@ def main():
     env_price_id = os.environ.get('PRICE_ID')
     if env_price_id:
         print(f'Using PRICE_ID from environment: {env_price_id}')
-        price = stripe.Price.retrieve(env_price_id)
-        time.sleep(SLEEP_BETWEEN_CALLS)
+        price = call(stripe.Price.retrieve, env_price_id)
 
         # Try to locate an annual price on the same product; fall back to creating one if possible
         annual_price = None
         try:
-            prod_id = getattr(price, 'product', None) or (price.get('product') if hasattr(price, 'get') else None)
+            prod_id = _field(price, 'product')
             if prod_id:
-                for pr in stripe.Price.list(product=prod_id).auto_paging_iter():
+                for pr in iter_all(stripe.Price.list, product=prod_id):
                     try:
-                        rec = getattr(pr, 'recurring', None) or (pr.get('recurring') if hasattr(pr, 'get') else None)
+                        rec = _field(pr, 'recurring')
                         if rec and rec.get('interval') == 'year':
                             annual_price = pr
                             break
@@ -275,38 +482,41 @@ def main():
         if not annual_price:
             # If we can determine a unit_amount and product, create an annual price (12x monthly)
             try:
-                unit = getattr(price, 'unit_amount', None) or (price.get('unit_amount') if hasattr(price, 'get') else None)
-                currency = getattr(price, 'currency', None) or (price.get('currency') if hasattr(price, 'get') else 'usd')
+                unit = _field(price, 'unit_amount')
+                currency = _field(price, 'currency', 'usd')
                 if unit and prod_id:
-                    annual_price = stripe.Price.create(
+                    annual_price = call(stripe.Price.create,
                         unit_amount=(int(unit) * 12),
                         currency=currency,
                         recurring={'interval': 'year'},
                         product=prod_id,
+                        metadata=run_metadata,
+                        idempotency_key=f'price:{run_id}:year',
                     )
-                    time.sleep(SLEEP_BETWEEN_CALLS)
             except Exception:
                 annual_price = None
     else:
         print('Creating product and price...')
-        product = stripe.Product.create(name='Test Product - Billing Historical')
-        time.sleep(SLEEP_BETWEEN_CALLS)
-        price = stripe.Price.create(
+        product = call(stripe.Product.create, name='Test Product - Billing Historical', metadata=run_metadata,
+                       idempotency_key=f'product:{run_id}')
+        price = call(stripe.Price.create,
             unit_amount=1000,
             currency='usd',
             recurring={'interval': 'month'},
             product=product.id,
+            metadata=run_metadata,
+            idempotency_key=f'price:{run_id}:month',
         )
-        time.sleep(SLEEP_BETWEEN_CALLS)
 
         # Create an annual price (12x monthly) for annual subscriptions
-        annual_price = stripe.Price.create(
+        annual_price = call(stripe.Price.create,
             unit_amount=1000 * 12,
             currency='usd',
             recurring={'interval': 'year'},
             product=product.id,
+            metadata=run_metadata,
+            idempotency_key=f'price:{run_id}:year',
         )
-        time.sleep(SLEEP_BETWEEN_CALLS)
 
     # Fixed baseline start time for test clocks (per user request)
     # Only change: set the initial test-clock baseline to 2025-01-01 00:00:00 UTC.
@@ -316,7 +526,6 @@ def main():
 
     # Prepare summary, created list, and MRR tracking per month
     summary = {'created_customers': 0, 'subscriptions': 0, 'invoices_paid': 0, 'invoices_unpaid': 0}
-    created_customers = []
     total_customers = args.count
 
     # Determine exact counts for each status (active and canceled)
@@ -332,259 +541,278 @@ def main():
 
     # Shuffle assignment so status/annual aren't correlated with index
     combined = list(zip(statuses, annual_flags))
-    random.shuffle(combined)
+    plan_rng = random.Random(args.seed)
+    plan_rng.shuffle(combined)
 
     # Randomly choose creation month for each customer so new users arrive in random monthly batches
-    creation_months = [random.randint(0, args.months - 1) for _ in range(total_customers)]
-
-    print(f'Planned status distribution: active={active_count}, canceled={canceled_count}, annual={annual_count}')
-
-    # (MRR tracking removed — not needed for test data generation)
-
-    # Create customers only in their assigned month and simulate remaining months for each customer
-    for month in range(args.months):
-        # creation time for customers created this month
-        creation_dt = (start + timedelta(days=30 * month)).replace(hour=0, minute=0, second=0, microsecond=0)
-        creation_ts = ts(creation_dt)
+    creation_months = plan_rng.choices(range(args.months), k=total_customers)
 
-        # find indexes to create this month
-        to_create = [i for i, cm in enumerate(creation_months) if cm == month]
+    # Price per customer index, resolved once
+    price_ids = [annual_price.id if is_annual else price.id for _, is_annual in combined]
 
-        for i in to_create:
-            # Determine assigned status and billing frequency for this index
-            chosen_status, is_annual = combined[i]
+    # Bucket customer indexes by creation month in one pass
+    buckets = [[] for _ in range(args.months)]
+    for i, cm in enumerate(creation_months):
+        buckets[cm].append(i)
 
-            # Use 'active' or 'cancel' as local-part prefix and '@actual.com' as domain
-            if chosen_status == 'canceled':
-                local = f'cancel{i+1}'
-            else:
-                local = f'active{i+1}'
-            email = f'{local}@actual.com'
-            cust_name = f'Test User {i+1}'
-
-            # Create a test clock starting at the customer's creation month
-            clock_name = f'clock_{i+1}_{int(time.time())}'
-            tc = create_test_clock(stripe, frozen_time=creation_ts, name=clock_name)
-            time.sleep(SLEEP_BETWEEN_CALLS)
+    print(f'Planned status distribution: active={active_count}, canceled={canceled_count}, annual={annual_count}')
 
-            # Create customer associated with the test clock
-            customer = stripe.Customer.create(email=email, name=cust_name, test_clock=tc.id)
-            time.sleep(SLEEP_BETWEEN_CALLS)
+    # (MRR tracking removed — not needed for test data generation)
 
-            # Determine which price to use
-            price_id = annual_price.id if is_annual else price.id
+    # Create customers only in their assigned month and simulate remaining months for each customer.
+    # Each customer owns its own test clock, so customers are simulated concurrently on a thread pool.
+    summary_lock = threading.Lock()
+    # Lines actually written to generated_customers.jsonl; a customer whose subscription later fails
+    # is still recorded (it exists in Stripe) but not counted in summary['created_customers']
+    records_written = 0
+
+    # Start-of-month timestamps, computed once: month_ts[m] is both the creation time for customers
+    # created in month m and the advance target for month m (month + m2 never exceeds args.months - 1)
+    month_ts = [
+        ts((start + timedelta(days=30 * m)).replace(hour=0, minute=0, second=0, microsecond=0))
+        for m in range(args.months)
+    ]
+
+    def pay_open_invoices(customer_id, count_unpaid):
+        # Pay every open invoice for the customer concurrently; returns the ids that were paid
+        try:
+            invoices = call(stripe.Invoice.list, customer=customer_id, status='open', limit=100)
+            ids = [inv.id for inv in invoices.auto_paging_iter()]
+        except Exception:
+            return set()
+        if not ids:
+            return set()
+
+        with ThreadPoolExecutor(max_workers=min(PAY_CONCURRENCY, len(ids))) as pay_ex:
+            results = list(pay_ex.map(lambda iid: safe_pay(iid, idempotency_key=f'pay:{run_id}:{iid}'), ids))
+
+        paid_ids = {iid for iid, ok in zip(ids, results) if ok}
+        with summary_lock:
+            summary['invoices_paid'] += len(paid_ids)
+            if count_unpaid:
+                summary['invoices_unpaid'] += len(ids) - len(paid_ids)
+        return paid_ids
+
+    def simulate_customer(i, month):
+        nonlocal records_written
+        # Per-customer RNG keeps results reproducible for a given --seed regardless of thread scheduling
+        rng = random.Random(f'{args.seed}:{i}')
+
+        # Determine assigned status and billing frequency for this index
+        chosen_status, is_annual = combined[i]
+
+        # Use 'active' or 'cancel' as local-part prefix and '@actual.com' as domain
+        if chosen_status == 'canceled':
+            local = f'cancel{i+1}'
+        else:
+            local = f'active{i+1}'
+        email = f'{local}@actual.com'
+        cust_name = f'Test User {i+1}'
+
+        # Create a test clock starting at the customer's creation month
+        clock_name = f'clock_{i+1}_{int(time.time())}'
+        tc = create_test_clock(stripe, frozen_time=month_ts[month], name=clock_name, idempotency_key=f'clock:{run_id}:{i}')
+
+        # Create customer associated with the test clock, attaching the working test card inline
+        # (Stripe makes the first attached card the default_source). If the source is rejected,
+        # create the customer bare and attach the card separately.
+        try:
+            customer = call(stripe.Customer.create, email=email, name=cust_name, test_clock=tc.id, source='tok_visa', metadata=run_metadata,
+                            idempotency_key=f'cust:{run_id}:{i}')
+        except stripe.error.InvalidRequestError:
+            customer = call(stripe.Customer.create, email=email, name=cust_name, test_clock=tc.id, metadata=run_metadata,
+                            idempotency_key=f'cust:{run_id}:{i}:bare')
+            try:
+                call(stripe.Customer.create_source, customer.id, source='tok_visa')
+            except Exception:
+                pass
+        with summary_lock:
+            customers_fh.write(json.dumps({'email': email, 'id': customer.id}) + '\n')
+            customers_fh.flush()
+            records_written += 1
 
-            if chosen_status == 'canceled':
-                # Canceled flow: keep logic intact, but simulate only remaining months
-                try:
-                    stripe.Customer.create_source(customer.id, source='tok_visa')
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-                except Exception:
-                    pass
+        price_id = price_ids[i]
 
-                try:
-                    sub = stripe.Subscription.create(customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'])
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-                except Exception:
-                    sub = stripe.Subscription.create(customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'])
-                    time.sleep(SLEEP_BETWEEN_CALLS)
+        if chosen_status == 'canceled':
+            # Canceled flow: keep logic intact, but simulate only remaining months
+            try:
+                sub = call(stripe.Subscription.create, customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'], metadata=run_metadata,
+                           idempotency_key=f'sub:{run_id}:{i}')
+            except Exception:
+                sub = call(stripe.Subscription.create, customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'], metadata=run_metadata,
+                           idempotency_key=f'sub:{run_id}:{i}')
 
+            with summary_lock:
                 summary['created_customers'] += 1
                 summary['subscriptions'] += 1
-                created_customers.append({'email': email, 'id': customer.id})
 
-                months_remaining = args.months - month
-                cancel_after = random.randint(1, max(1, months_remaining))
+            months_remaining = args.months - month
+            cancel_after = rng.randint(1, max(1, months_remaining))
 
-                for m2 in range(months_remaining):
-                    current_dt = (start + timedelta(days=30 * (month + m2))).replace(hour=0, minute=0, second=0, microsecond=0)
-                    current_ts = ts(current_dt)
-                    try:
-                        advance_test_clock(stripe, tc.id, frozen_time=current_ts)
-                    except Exception as e:
-                        print(f'  Warning: failed to advance test clock to {current_ts} for {email}: {e}')
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-
-                    # Give Stripe a moment to generate invoices
-                    time.sleep(0.25)
+            for m2 in range(months_remaining):
+                current_ts = month_ts[month + m2]
+                try:
+                    advance_test_clock(stripe, tc.id, frozen_time=current_ts)
+                except Exception as e:
+                    print(f'  Warning: failed to advance test clock to {current_ts} for {email}: {e}')
 
-                    try:
-                        invoices = stripe.Invoice.list(customer=customer.id)
-                        for inv in invoices.auto_paging_iter():
-                            if inv.status in ('open', 'draft'):
-                                try:
-                                    stripe.Invoice.pay(inv.id)
-                                    summary['invoices_paid'] += 1
-                                except Exception:
-                                    pass
-                    except Exception:
+                if (m2 + 1) >= cancel_after:
+                    canceled = cancel_subscription_retry(sub.id)
+                    if canceled:
                         pass
+                    break
 
-                    if (m2 + 1) >= cancel_after:
-                        canceled = cancel_subscription_retry(sub.id)
-                        if canceled:
-                            pass
-                        break
+            # One pass over the invoices generated by all advances (open only, filtered server-side)
+            paid_ids = pay_open_invoices(customer.id, count_unpaid=False)
 
-                print(f'Created canceled customer {email} (customer id: {customer.id}), canceled after month {cancel_after} (created in month {month+1})')
+            print(f'Created canceled customer {email} (customer id: {customer.id}), canceled after month {cancel_after} (created in month {month+1})')
 
-                # Auto-advance this customer's test clock by +2 days to help finalize any pending invoices
-                try:
-                    cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-                    extra = 2 * 24 * 3600  # 2 days in seconds
-                    try:
-                        advance_test_clock(stripe, tc.id, frozen_time=cur + extra)
-                        print(f"[Auto Advance] Advanced test clock {tc.id} by +2 days ({extra} seconds)")
-                    except Exception as e:
-                        print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
-                except Exception:
-                    pass
+            # Nothing left to finalize or pay: skip the extra advance and finalize passes
+            if not has_pending_invoices(customer.id):
+                return
 
-                # After auto-advance, attempt to finalize/pay any draft/open invoices (retry a few times)
+            # Auto-advance this customer's test clock by +2 days to help finalize any pending invoices
+            try:
+                cur = call(TestClock.retrieve, tc.id).frozen_time
+                extra = 2 * 24 * 3600  # 2 days in seconds
                 try:
-                    for attempt in range(3):
-                        anything = False
-                        try:
-                            invoices = stripe.Invoice.list(customer=customer.id)
-                        except Exception:
-                            invoices = []
-                        for inv in invoices.auto_paging_iter():
-                            st = getattr(inv, 'status', None) or (inv.get('status') if hasattr(inv, 'get') else None)
-                            if st == 'draft':
-                                try:
-                                    stripe.Invoice.finalize_invoice(inv.id)
-                                    anything = True
-                                    time.sleep(0.2)
-                                except Exception:
-                                    pass
-                            # Try to pay if open or draft (pay may raise; ignore)
-                            st2 = st
+                    advance_test_clock(stripe, tc.id, frozen_time=cur + extra)
+                    print(f"[Auto Advance] Advanced test clock {tc.id} by +2 days ({extra} seconds)")
+                except Exception as e:
+                    print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
+            except Exception:
+                pass
+
+            # After auto-advance, attempt to finalize/pay any draft/open invoices (retry a few times)
+            try:
+                for attempt in range(3):
+                    anything = False
+                    try:
+                        invoices = call(stripe.Invoice.list, customer=customer.id)
+                    except Exception:
+                        invoices = []
+                    for inv in invoices.auto_paging_iter():
+                        if inv.id in paid_ids:
+                            continue
+                        st = _field(inv, 'status')
+                        if st == 'draft':
                             try:
-                                inv2 = stripe.Invoice.retrieve(inv.id)
-                                st2 = getattr(inv2, 'status', None) or (inv2.get('status') if hasattr(inv2, 'get') else None)
+                                finalized = call(stripe.Invoice.finalize_invoice, inv.id)
+                                st = _field(finalized, 'status', st)
+                                anything = True
+                                time.sleep(0.2)
                             except Exception:
                                 pass
-                            if st2 in ('open', 'draft'):
-                                try:
-                                    stripe.Invoice.pay(inv.id)
+                        # Try to pay if open or draft; status comes from the listing or the finalize response
+                        if st in ('open', 'draft'):
+                            try:
+                                call(stripe.Invoice.pay, inv.id, idempotency_key=f'pay:{run_id}:{inv.id}:{attempt}')
+                                paid_ids.add(inv.id)
+                                with summary_lock:
                                     summary['invoices_paid'] += 1
-                                    anything = True
-                                except Exception:
-                                    pass
-                        if not anything:
-                            break
-                        time.sleep(0.5)
-                except Exception:
-                    pass
-
-            else:
-                # Active/default flow: attach a working token and create subscription, then simulate remaining months
-                try:
-                    token_str = 'tok_visa'
-                    card = stripe.Customer.create_source(customer.id, source=token_str)
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-                    stripe.Customer.modify(customer.id, default_source=card.id)
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-                except Exception:
-                    pass
+                                anything = True
+                            except Exception:
+                                pass
+                    if not anything:
+                        break
+                    time.sleep(0.5)
+            except Exception:
+                pass
 
-                try:
-                    sub = stripe.Subscription.create(customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'])
-                    time.sleep(SLEEP_BETWEEN_CALLS)
-                except Exception:
-                    sub = stripe.Subscription.create(customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'])
-                    time.sleep(SLEEP_BETWEEN_CALLS)
+        else:
+            # Active/default flow: create subscription on the default card, then simulate remaining months
+            try:
+                sub = call(stripe.Subscription.create, customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'], metadata=run_metadata,
+                           idempotency_key=f'sub:{run_id}:{i}')
+            except Exception:
+                sub = call(stripe.Subscription.create, customer=customer.id, items=[{'price': price_id}], expand=['latest_invoice'], metadata=run_metadata,
+                           idempotency_key=f'sub:{run_id}:{i}')
 
+            with summary_lock:
                 summary['created_customers'] += 1
                 summary['subscriptions'] += 1
-                created_customers.append({'email': email, 'id': customer.id})
 
-                months_remaining = args.months - month
-                for m2 in range(months_remaining):
-                    current_dt = (start + timedelta(days=30 * (month + m2))).replace(hour=0, minute=0, second=0, microsecond=0)
-                    current_ts = ts(current_dt)
-                    try:
-                        advance_test_clock(stripe, tc.id, frozen_time=current_ts)
-                    except Exception as e:
-                        print(f'  Warning: failed to advance test clock to {current_ts} for {email}: {e}')
-                    time.sleep(SLEEP_BETWEEN_CALLS)
+            months_remaining = args.months - month
+            for m2 in range(months_remaining):
+                current_ts = month_ts[month + m2]
+                try:
+                    advance_test_clock(stripe, tc.id, frozen_time=current_ts)
+                except Exception as e:
+                    print(f'  Warning: failed to advance test clock to {current_ts} for {email}: {e}')
 
-                    time.sleep(0.2)
+            # One pass over the invoices generated by all advances (open only, filtered server-side)
+            paid_ids = pay_open_invoices(customer.id, count_unpaid=True)
 
-                    try:
-                        invoices = stripe.Invoice.list(customer=customer.id)
-                        for inv in invoices.auto_paging_iter():
-                            if inv.status in ('open', 'draft'):
-                                try:
-                                    stripe.Invoice.pay(inv.id)
-                                    summary['invoices_paid'] += 1
-                                except Exception:
-                                    summary['invoices_unpaid'] += 1
-                    except Exception:
-                        pass
+            # Nothing left to finalize or pay: skip the extra advance and finalize passes
+            if not has_pending_invoices(customer.id):
+                return
 
-                # Auto-advance this customer's test clock by +2 days to help finalize any pending invoices
+            # Auto-advance this customer's test clock by +2 days to help finalize any pending invoices
+            try:
+                cur = call(TestClock.retrieve, tc.id).frozen_time
+                extra = 2 * 24 * 3600
                 try:
-                    cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-                    extra = 2 * 24 * 3600
-                    try:
-                        advance_test_clock(stripe, tc.id, frozen_time=cur + extra)
-                        print(f"[Auto Advance] Advanced test clock {tc.id} by +2 days ({extra} seconds)")
-                    except Exception as e:
-                        print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
-                except Exception:
-                    pass
+                    advance_test_clock(stripe, tc.id, frozen_time=cur + extra)
+                    print(f"[Auto Advance] Advanced test clock {tc.id} by +2 days ({extra} seconds)")
+                except Exception as e:
+                    print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
+            except Exception:
+                pass
 
-                # After auto-advance, attempt to finalize/pay any draft/open invoices (retry a few times)
-                try:
-                    for attempt in range(3):
-                        anything = False
-                        try:
-                            invoices = stripe.Invoice.list(customer=customer.id)
-                        except Exception:
-                            invoices = []
-                        for inv in invoices.auto_paging_iter():
-                            st = getattr(inv, 'status', None) or (inv.get('status') if hasattr(inv, 'get') else None)
-                            if st == 'draft':
-                                try:
-                                    stripe.Invoice.finalize_invoice(inv.id)
-                                    anything = True
-                                    time.sleep(0.2)
-                                except Exception:
-                                    pass
-                            # Try to pay if open or draft
-                            st2 = st
+            # After auto-advance, attempt to finalize/pay any draft/open invoices (retry a few times)
+            try:
+                for attempt in range(3):
+                    anything = False
+                    try:
+                        invoices = call(stripe.Invoice.list, customer=customer.id)
+                    except Exception:
+                        invoices = []
+                    for inv in invoices.auto_paging_iter():
+                        if inv.id in paid_ids:
+                            continue
+                        st = _field(inv, 'status')
+                        if st == 'draft':
                             try:
-                                inv2 = stripe.Invoice.retrieve(inv.id)
-                                st2 = getattr(inv2, 'status', None) or (inv2.get('status') if hasattr(inv2, 'get') else None)
+                                finalized = call(stripe.Invoice.finalize_invoice, inv.id)
+                                st = _field(finalized, 'status', st)
+                                anything = True
+                                time.sleep(0.2)
                             except Exception:
                                 pass
-                            if st2 in ('open', 'draft'):
-                                try:
-                                    stripe.Invoice.pay(inv.id)
+                        # Try to pay if open or draft; status comes from the listing or the finalize response
+                        if st in ('open', 'draft'):
+                            try:
+                                call(stripe.Invoice.pay, inv.id, idempotency_key=f'pay:{run_id}:{inv.id}:{attempt}')
+                                paid_ids.add(inv.id)
+                                with summary_lock:
                                     summary['invoices_paid'] += 1
-                                    anything = True
-                                except Exception:
-                                    pass
-                        if not anything:
-                            break
-                        time.sleep(0.5)
-                except Exception:
-                    pass
+                                anything = True
+                            except Exception:
+                                pass
+                    if not anything:
+                        break
+                    time.sleep(0.5)
+            except Exception:
+                pass
+
+    # Persist created customer ids as they are created (one JSON object per line) so partial
+    # runs still leave a usable record for downstream ingestion
+    threading.stack_size(WORKER_STACK_SIZE)
+    with open('generated_customers.jsonl', 'w', encoding='utf-8') as customers_fh:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+            futures = []
+            for month in range(args.months):
+                futures.extend(ex.submit(simulate_customer, i, month) for i in buckets[month])
+
+            for fut in futures:
+                fut.result()
 
     print('\nSummary:')
     for k, v in summary.items():
         print(f'- {k}: {v}')
     # Print normalized MRR by month (annual invoices are divided by 12)
     # MRR printing removed — not required for test data generation
-    # persist created customer ids to a file for downstream ingestion convenience
-    try:
-        import json
-        with open('generated_customers.json', 'w', encoding='utf-8') as fh:
-            json.dump(created_customers, fh, indent=2)
-        print(f"Wrote {len(created_customers)} created customers to generated_customers.json")
-    except Exception:
-        pass
+    print(f"Wrote {records_written} created customers to generated_customers.jsonl")
     print('\nDone. Check the Stripe Dashboard (test mode) to inspect customers, subscriptions, invoices, and test clocks.')
 
 
@@ -1,11 +1,17 @@
 import os
+import json
 import time
+import asyncio
 import argparse
 import random
+import uuid
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 from dotenv import load_dotenv
 
+import requests
 import stripe
+from urllib3.util.retry import Retry
 
 """
 Generate Stripe test data with Test Clocks:
@@ -30,6 +36,81 @@ load_dotenv()
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 PRICE_ID = os.getenv("PRICE_ID")
 
+# Test clocks bill on a fixed 30-day "month"
+MONTH = 30 * 24 * 3600
+
+def configure_http_client(pool_maxsize: int = 32):
+    """Share one keep-alive requests.Session across every Stripe call (and every to_thread worker),
+    so the run pays for a handful of TLS handshakes instead of one per call.
+    The adapter only retries failed connects (the request never left, so any method is safe);
+    429/5xx and lost responses are left to stripe_call, which sees the real response headers."""
+    session = requests.Session()
+    retry = Retry(connect=3, read=0, status=0, backoff_factor=0.5)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount("https://", adapter)
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=30, session=session)
+
+# Errors Stripe documents as safe to replay: throttling, network failures, and 5xx
+TRANSIENT_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError, stripe.error.APIError)
+CALL_MAX_ATTEMPTS = 5
+# SDK methods that only read; every other method passed to stripe_call is a write (POST/DELETE)
+READ_METHODS = {"retrieve", "list", "search", "<lambda>"}
+
+async def stripe_call(fn, *args, **kwargs):
+    """Run a blocking stripe-python call in a worker thread so independent calls can overlap.
+    Transient errors are retried with capped, fully-jittered backoff (see backoff_delay).
+
+    Replaying a write after a timeout or 5xx is only safe with an idempotency key (Stripe may
+    already have committed it), so writes get one key for the logical call, reused by every
+    attempt, unless the caller passed its own."""
+    if getattr(fn, "__name__", "") not in READ_METHODS:
+        kwargs.setdefault("idempotency_key", f"learn-{uuid.uuid4()}")
+    for attempt in range(CALL_MAX_ATTEMPTS):
+        try:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        except TRANSIENT_ERRORS as e:
+            headers = getattr(e, "headers", None) or {}
+            if attempt == CALL_MAX_ATTEMPTS - 1 or headers.get("Stripe-Should-Retry") == "false":
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[Retry] {type(e).__name__} from {getattr(fn, '__qualname__', fn)}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+async def list_all(fn, **params) -> list:
+    """Run a Stripe list/search call and drain its auto-pagination in a worker thread."""
+    return await stripe_call(lambda: list(fn(**params).auto_paging_iter()))
+
+async def gather_bounded(coros, limit: int):
+    """asyncio.gather with at most `limit` coroutines in flight; exceptions are returned, not raised."""
+    sem = asyncio.Semaphore(limit)
+
+    async def bounded(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*[bounded(c) for c in coros], return_exceptions=True)
+
+class TokenBucket:
+    """Async token bucket: allows bursts of up to `burst` calls, refilling at `rate` tokens/sec."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 def must_env(name: str) -> str:
     v = os.getenv(name)
     if not v:
@@ -42,25 +123,100 @@ def utc_now_ts() -> int:
 def dt(ts: int) -> str:
     return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-def wait_until_testclock_ready(test_clock_id: str, timeout_sec: int = 240):
-    """Stripe test clock transitions to 'ready' after advances. Poll until ready."""
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 8.0, floor: float = 0.2) -> float:
+    """Capped exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt)), never below floor."""
+    return max(floor, random.uniform(0, min(cap, base * (2 ** attempt))))
+
+class ClockReadyWatcher:
+    """Resolve test-clock waits from `test_helpers.test_clock.ready` events.
+
+    A single background task lists recent ready events and wakes every waiter whose
+    clock reached its target frozen_time, so N clocks advancing at once (batch mode) share
+    one Event.list per tick. Waiters also poll their clock (wait_until_testclock_ready),
+    since events can lag.
+    """
+
+    EVENT_TYPE = "test_helpers.test_clock.ready"
+
+    def __init__(self, poll_sec: float = 0.5):
+        self.poll_sec = poll_sec
+        self.waiters = {}  # (test_clock_id, frozen_time) -> (future, started_at)
+        self.task = None
+
+    async def wait(self, test_clock_id: str, frozen_time: int, timeout_sec: float):
+        key = (test_clock_id, frozen_time)
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters[key] = (fut, int(time.time()))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        try:
+            return await asyncio.wait_for(fut, timeout_sec)
+        finally:
+            self.waiters.pop(key, None)
+
+    async def _run(self):
+        while self.waiters:
+            # Event.created is wall-clock time; a couple of seconds of slack covers clock skew
+            since = min(started for _, started in self.waiters.values()) - 2
+            try:
+                events = await stripe_call(stripe.Event.list, type=self.EVENT_TYPE, created={"gte": since}, limit=100)
+            except stripe.error.StripeError as e:
+                print(f"[Warning] could not list {self.EVENT_TYPE} events: {e}")
+                events = None
+            for ev in (events.data if events else []):
+                tc = ev.data.object
+                # Clocks only move forward, so a ready snapshot at/after the target belongs to this advance
+                for (tc_id, target), (fut, _) in list(self.waiters.items()):
+                    if tc_id == tc["id"] and tc["frozen_time"] >= target and not fut.done():
+                        fut.set_result(tc)
+            await asyncio.sleep(self.poll_sec)
+
+CLOCK_READY = ClockReadyWatcher()
+# Longest wait on the ready event; the direct poll below runs alongside it the whole time
+CLOCK_EVENT_WAIT_SEC = 60
+
+async def _poll_until_ready(test_clock_id: str, frozen_time: Optional[int], timeout_sec: int):
+    """TestClock.retrieve with jittered backoff until the clock is ready (at/after frozen_time if given)."""
     start = time.time()
+    attempt = 0
     while True:
-        tc = stripe.test_helpers.TestClock.retrieve(test_clock_id)
+        tc = await stripe_call(stripe.test_helpers.TestClock.retrieve, test_clock_id)
         status = tc.get("status")
-        if status == "ready":
+        if status == "ready" and (frozen_time is None or (tc.get("frozen_time") or 0) >= frozen_time):
             return tc
         if time.time() - start > timeout_sec:
             raise TimeoutError(f"TestClock {test_clock_id} not ready after {timeout_sec}s (status={status})")
-        time.sleep(1)
-
-def advance_clock(test_clock_id: str, new_frozen_time: int):
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+async def wait_until_testclock_ready(test_clock_id: str, frozen_time: Optional[int] = None, timeout_sec: int = 240):
+    """Stripe test clock transitions to 'ready' after advances. When the target frozen_time is
+    known, the ready event (see ClockReadyWatcher) and a backoff poll of the clock race, and the
+    first to see the clock ready wins; Event.list is eventually consistent, so the poll usually
+    answers first for short advances and the event saves polling on long ones."""
+    poll = asyncio.create_task(_poll_until_ready(test_clock_id, frozen_time, timeout_sec))
+    if frozen_time is None:
+        return await poll
+    event = asyncio.create_task(CLOCK_READY.wait(test_clock_id, frozen_time, min(CLOCK_EVENT_WAIT_SEC, timeout_sec)))
+    try:
+        done, _ = await asyncio.wait({poll, event}, return_when=asyncio.FIRST_COMPLETED)
+        if event in done and event.exception() is None:
+            return event.result()
+        # the poll finished (ready or timed out), or the event wait gave up: the poll decides
+        return await poll
+    finally:
+        for task in (poll, event):
+            if not task.done():
+                task.cancel()
+
+async def advance_clock(test_clock_id: str, new_frozen_time: int, cur: Optional[int] = None) -> int:
     """
     Advance test clock to new_frozen_time (unix seconds).
-    Must be > current frozen_time.
+    Must be > current frozen_time. Pass the caller's cached `cur` to skip the
+    extra retrieve; returns the clock's new frozen_time.
     """
-    tc = stripe.test_helpers.TestClock.retrieve(test_clock_id)
-    cur = tc["frozen_time"]
+    if cur is None:
+        cur = (await stripe_call(stripe.test_helpers.TestClock.retrieve, test_clock_id))["frozen_time"]
     if new_frozen_time <= cur:
         # Avoid raising: if requested time is not strictly greater than current frozen_time,
         # advance to just after current time to keep timeline moving.
@@ -71,18 +227,34 @@ def advance_clock(test_clock_id: str, new_frozen_time: int):
     print(f"\n[Advance TestClock] {test_clock_id}")
     print(f"  from: {cur} ({dt(cur)})")
     print(f"  to  : {new_frozen_time} ({dt(new_frozen_time)})")
-    stripe.test_helpers.TestClock.advance(test_clock_id, frozen_time=new_frozen_time)
-    wait_until_testclock_ready(test_clock_id)
-    tc2 = stripe.test_helpers.TestClock.retrieve(test_clock_id)
+    await stripe_call(stripe.test_helpers.TestClock.advance, test_clock_id, frozen_time=new_frozen_time)
+    tc2 = await wait_until_testclock_ready(test_clock_id, new_frozen_time)
     print(f"  done: frozen_time={tc2['frozen_time']} ({dt(tc2['frozen_time'])}) status={tc2['status']}")
+    return tc2["frozen_time"]
+
+# Local record of test clocks this script created, so cleanup can delete them without listing
+# every clock in the account (TestClock has no search endpoint)
+TC_ID_CACHE = ".learn_tc_ids.json"
+
+def load_tc_ids() -> Optional[list]:
+    try:
+        with open(TC_ID_CACHE, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def save_tc_ids(ids: list):
+    with open(TC_ID_CACHE, "w", encoding="utf-8") as fh:
+        json.dump(ids, fh)
 
-def create_testclock(start_time: int) -> stripe.test_helpers.TestClock:
-    tc = stripe.test_helpers.TestClock.create(frozen_time=start_time, name=f"learn_tc_{start_time}")
+async def create_testclock(start_time: int) -> stripe.test_helpers.TestClock:
+    tc = await stripe_call(stripe.test_helpers.TestClock.create, frozen_time=start_time, name=f"learn_tc_{start_time}")
     print(f"[Create TestClock] id={tc.id} frozen_time={tc.frozen_time} ({dt(tc.frozen_time)})")
+    save_tc_ids((load_tc_ids() or []) + [tc.id])
     return tc
 
-def create_customer(email: str, test_clock_id: str) -> stripe.Customer:
-    c = stripe.Customer.create(
+async def create_customer(email: str, test_clock_id: str) -> stripe.Customer:
+    c = await stripe_call(stripe.Customer.create,
         email=email,
         name=email.split("@")[0],
         test_clock=test_clock_id,
@@ -111,112 +283,80 @@ def create_customer(email: str, test_clock_id: str) -> stripe.Customer:
 #     print(f"[Create PM] id={pm.id} card=****{card_number[-4:]}")
 #     return pm
 
-def create_payment_method(card: str) -> stripe.PaymentMethod:
+async def create_payment_method(card: str) -> stripe.PaymentMethod:
     """
     card supports:
-      - tok_* : Stripe test token (recommended)
-      - pm_*  : existing PaymentMethod id (if you already have one)
+      - tok_* : Stripe test token (creates a PaymentMethod)
+      - pm_*  : existing or Stripe pre-made test PaymentMethod id (e.g. pm_card_visa); no API call
     """
     if not isinstance(card, str):
         raise RuntimeError("card must be a string like tok_visa or tok_chargeDeclined")
 
     # Create a real PaymentMethod object from a token (no raw card numbers)
     if card.startswith("tok_"):
-        pm = stripe.PaymentMethod.create(
+        pm = await stripe_call(stripe.PaymentMethod.create,
             type="card",
             card={"token": card},
         )
         print(f"[Create PM from token] token={card} pm={pm.id}")
         return pm
 
-    # If it's already a PaymentMethod id, just "wrap" it
+    # If it's already a PaymentMethod id, just "wrap" it; attach validates it anyway
     if card.startswith("pm_"):
-        pm = stripe.PaymentMethod.retrieve(card)
+        pm = stripe.PaymentMethod.construct_from({"id": card, "customer": None}, stripe.api_key)
         print(f"[Use Existing PM] id={pm.id}")
         return pm
 
     raise RuntimeError("Unsupported card. Use tok_* or pm_*")
 
 #debug
-def create_card_source(customer_id: str, token: str) -> str:
+async def create_card_source(customer_id: str, token: str) -> str:
     """
     Create a card source on the customer using a tok_* token.
     Returns source id (card_...).
     """
-    card = stripe.Customer.create_source(customer_id, source=token)
+    card = await stripe_call(stripe.Customer.create_source, customer_id, source=token)
     # card is a Card object with id like card_...
     print(f"[Create Card Source] token={token} source={card.id} brand={getattr(card,'brand',None)} last4={getattr(card,'last4',None)}")
     return card.id
 
-def set_default_source(customer_id: str, source_id: str):
-    stripe.Customer.modify(customer_id, default_source=source_id)
+async def set_default_source(customer_id: str, source_id: str):
+    await stripe_call(stripe.Customer.modify, customer_id, default_source=source_id)
     print(f"[Set Default Source] customer={customer_id} default_source={source_id}")
 
 
-def attach_and_set_default_pm(customer_id: str, pm_id: str):
+async def attach_and_set_default_pm(customer_id: str, pm: stripe.PaymentMethod) -> stripe.PaymentMethod:
     # Attach the payment method to the customer and set it as the default for invoices.
-    # Robust flow: attach -> retrieve -> verify 'customer' field -> retry attach if needed.
-    pm_to_use = pm_id
-    try:
-        attached = stripe.PaymentMethod.attach(pm_id, customer=customer_id)
-        attached_id = getattr(attached, "id", None) or pm_id
-
-        # Retrieve the payment method to verify it's attached to this customer
+    # The attach response is authoritative (customer is populated on success, errors raise),
+    # so there is no verification retrieve; transient errors are retried inside stripe_call.
+    # Returns the attached PM (pre-made pm_card_* ids attach as a new PM): pass it back in
+    # on later switches and the attach is skipped.
+    pm_to_use = pm.id
+    if pm.get("customer") != customer_id:
         try:
-            pm_obj = stripe.PaymentMethod.retrieve(attached_id)
-        except Exception:
-            pm_obj = attached
-
-        pm_customer = pm_obj.get("customer") if hasattr(pm_obj, "get") else getattr(pm_obj, "customer", None)
-        if pm_customer != customer_id:
-            # Try attaching again using the returned id
-            try:
-                attached2 = stripe.PaymentMethod.attach(attached_id, customer=customer_id)
-                attached_id = getattr(attached2, "id", attached_id)
-                try:
-                    pm_obj = stripe.PaymentMethod.retrieve(attached_id)
-                except Exception:
-                    pass
-                pm_customer = pm_obj.get("customer") if hasattr(pm_obj, "get") else getattr(pm_obj, "customer", None)
-            except Exception:
-                pm_customer = None
-
-        if pm_customer == customer_id:
-            pm_to_use = attached_id
-        else:
-            # Fall back to original id; Customer.modify may still fail if not attached.
-            pm_to_use = pm_id
-    except Exception:
-        # Attach failed (not allowed or other error) — fall back to provided id
-        pm_to_use = pm_id
+            pm = await stripe_call(stripe.PaymentMethod.attach, pm.id, customer=customer_id)
+            pm_to_use = pm.id
+        except stripe.error.StripeError as e:
+            # Fall back to the provided id; Customer.modify below reports if it is unusable
+            print(f"[Warning] Could not attach payment method {pm_to_use} to customer {customer_id}: {e}")
 
-    # Try to set as default; if Stripe complains the PM isn't attached, attempt attach once more and retry.
     try:
-        stripe.Customer.modify(
+        await stripe_call(stripe.Customer.modify,
             customer_id,
             invoice_settings={"default_payment_method": pm_to_use},
         )
         print(f"[Set Default PM] customer={customer_id} default_payment_method={pm_to_use}")
-    except Exception as e:
-        # Attempt to attach and retry once
-        try:
-            stripe.PaymentMethod.attach(pm_to_use, customer=customer_id)
-            stripe.Customer.modify(
-                customer_id,
-                invoice_settings={"default_payment_method": pm_to_use},
-            )
-            print(f"[Set Default PM after attach] customer={customer_id} default_payment_method={pm_to_use}")
-        except Exception:
-            # Give up but log a helpful message
-            print(f"[Error] Could not set default payment method {pm_to_use} for customer {customer_id}: {e}")
+    except stripe.error.StripeError as e:
+        print(f"[Error] Could not set default payment method {pm_to_use} for customer {customer_id}: {e}")
+    return pm
 
-def create_subscription_monthly(customer_id: str, price_id: str, billing_anchor_ts: int) -> stripe.Subscription:
+async def create_subscription_monthly(customer_id: str, price_id: str, billing_anchor_ts: int) -> stripe.Subscription:
     """
     Create a subscription whose first billing cycle starts at billing_anchor_ts.
     We avoid immediate charge at creation time by setting billing_cycle_anchor in the future
     and turning off prorations.
     """
-    sub = stripe.Subscription.create(
+    sub = await stripe_call(stripe.Subscription.create,
         customer=customer_id,
         items=[{"price": price_id, "quantity": 1}],
         collection_method="charge_automatically",
@@ -235,11 +375,22 @@ def create_subscription_monthly(customer_id: str, price_id: str, billing_anchor_
             print(f"  payment_intent={pi['id']} pi_status={pi['status']}")
     return sub
 
-def retrieve_triplet(sub_id: str):
-    """Retrieve subscription, latest_invoice, payment_intent (expanded)."""
-    sub = stripe.Subscription.retrieve(sub_id, expand=["latest_invoice.payment_intent"])
+# Everything a cycle needs in one Subscription.retrieve: invoice + PI, customer (default PM) and test clock
+SUB_EXPAND = ["latest_invoice.payment_intent", "customer", "test_clock"]
+
+# Set from --verbose: log (and pay for) a retrieve_triplet after every advance, not just state transitions
+VERBOSE = False
+
+async def retrieve_triplet(sub_id: str, force: bool = False):
+    """Retrieve subscription, latest_invoice, payment_intent, customer and test_clock (expanded).
+    Logging-only calls are skipped (returning None) unless VERBOSE or `force` is set."""
+    if not (VERBOSE or force):
+        return None
+    sub = await stripe_call(stripe.Subscription.retrieve, sub_id, expand=SUB_EXPAND)
     li = sub.latest_invoice
     pi = li.get("payment_intent") if li else None
+    cust = sub.get("customer")
+    sub_tc = sub.get("test_clock")
 
     print("\n[Retrieve] subscription / latest_invoice / payment_intent")
     cpe = sub.get("current_period_end")
@@ -257,6 +408,10 @@ def retrieve_triplet(sub_id: str):
         print(f"  pi : {pi['id']} status={pi['status']} last_payment_error={('yes' if pi.get('last_payment_error') else 'no')}")
     else:
         print("  pi : None")
+    if cust and not isinstance(cust, str):
+        print(f"  cus: {cust['id']} default_payment_method={(cust.get('invoice_settings') or {}).get('default_payment_method')}")
+    if sub_tc and not isinstance(sub_tc, str):
+        print(f"  tc : {sub_tc['id']} frozen_time={sub_tc['frozen_time']} ({dt(sub_tc['frozen_time'])}) status={sub_tc.get('status')}")
 
     return sub
 
@@ -296,29 +451,38 @@ def get_sub_next_cycle(sub: stripe.Subscription) -> int:
     return utc_now_ts() + 60
 
 
-def next_cycle_after(billing_anchor: int, cycle_index: int, cur_frozen: int, month: int = 30 * 24 * 3600) -> int:
+def next_cycle_after(billing_anchor: int, cycle_index: int, cur_frozen: int, month: int = MONTH) -> int:
     """Return the next cycle timestamp for `cycle_index` that is strictly after `cur_frozen`.
-    If the nominal cycle (billing_anchor + cycle_index*month + 60) is in the past, compute the
+    If the nominal cycle (billing_anchor + cycle_index*month + 60) is in the past, use the
     smallest k >= cycle_index such that billing_anchor + k*month + 60 > cur_frozen.
     """
-    desired = int(billing_anchor) + int(cycle_index) * int(month) + 60
-    if desired > cur_frozen:
-        return desired
-
-    # number of full months elapsed since billing_anchor to move past cur_frozen
-    # compute k = floor((cur_frozen - billing_anchor - 60) / month) + 1
-    elapsed = cur_frozen - int(billing_anchor) - 60
-    if elapsed < 0:
-        k = cycle_index
-    else:
-        k = (elapsed // month) + 1
-    # ensure we don't return an index smaller than cycle_index
-    if k < cycle_index:
-        k = cycle_index
-    return int(billing_anchor) + k * int(month) + 60
+    base = billing_anchor + 60
+    # k = floor((cur_frozen - base) / month) + 1 is the first cycle after cur_frozen
+    k = max(cycle_index, (cur_frozen - base) // month + 1)
+    return base + k * month
+
+
+INVOICE_EVENT_TYPES = ["invoice.payment_failed", "invoice.payment_succeeded", "invoice.payment_action_required"]
 
+async def latest_invoice_event(sub_id: str, since: int, seen: set):
+    """Invoice snapshot from the newest unseen payment event for `sub_id` created at/after `since`
+    (wall-clock seconds), or None if Stripe has not surfaced one (yet)."""
+    try:
+        events = await stripe_call(stripe.Event.list, types=INVOICE_EVENT_TYPES, created={"gte": since}, limit=100)
+    except stripe.error.StripeError as e:
+        print(f"[Warning] could not list invoice events: {e}")
+        return None
+    newest = None
+    for ev in events.data:  # newest first
+        inv = ev.data.object
+        if ev.id in seen or inv.get("subscription") != sub_id:
+            continue
+        seen.add(ev.id)
+        if newest is None:
+            newest = inv
+    return newest
 
-def advance_through_retries(tc_id: str, sub_id: str, buffer_seconds: int = 60, max_rounds: int = 10):
+async def advance_through_retries(tc_id: str, sub_id: str, buffer_seconds: int = 60, max_rounds: int = 10, cur: Optional[int] = None, sub=None) -> Optional[int]:
     """
     Advance the test clock through Stripe's scheduled retry timestamps by
     inspecting the subscription's latest invoice `next_payment_attempt` field.
@@ -327,14 +491,31 @@ def advance_through_retries(tc_id: str, sub_id: str, buffer_seconds: int = 60, m
     schedule is configured in the Dashboard and not exposed as a simple
     constant via the API. We iterate up to `max_rounds` times, advancing
     to the invoice's `next_payment_attempt + buffer_seconds` each loop.
+
+    Each round needs one read. The first round uses `sub` if the caller just
+    fetched one via retrieve_triplet. After an advance, the invoice snapshot is
+    taken from the payment event that advance produced (one small Event.list);
+    the round falls back to an expanded Subscription.retrieve when there is no
+    such event yet, or when a verbose retrieve_triplet already returned the
+    subscription. The latest known frozen_time is returned.
     """
+    fallbacks = 0
+    seen_events = set()
+    advanced_at = None
     for round_idx in range(max_rounds):
-        sub = stripe.Subscription.retrieve(sub_id, expand=["latest_invoice.payment_intent"])
         li = None
-        try:
-            li = sub.latest_invoice
-        except Exception:
-            li = sub.get("latest_invoice") if hasattr(sub, "get") else None
+        if sub is None and advanced_at is not None:
+            li = await latest_invoice_event(sub_id, advanced_at, seen_events)
+        if li is None:
+            if sub is None:
+                sub = await stripe_call(stripe.Subscription.retrieve, sub_id, expand=SUB_EXPAND)
+            sub_tc = sub.get("test_clock") if hasattr(sub, "get") else getattr(sub, "test_clock", None)
+            if sub_tc is not None and not isinstance(sub_tc, str):
+                cur = sub_tc["frozen_time"]
+            try:
+                li = sub.latest_invoice
+            except Exception:
+                li = sub.get("latest_invoice") if hasattr(sub, "get") else None
 
         if not li:
             print(f"[advance_through_retries] no latest_invoice found for subscription {sub_id}; stopping")
@@ -354,71 +535,113 @@ def advance_through_retries(tc_id: str, sub_id: str, buffer_seconds: int = 60, m
 
         # If Stripe provides a next_payment_attempt timestamp, advance to it
         if next_attempt:
-            cur = stripe.test_helpers.TestClock.retrieve(tc_id).frozen_time
+            if cur is None:
+                cur = (await stripe_call(stripe.test_helpers.TestClock.retrieve, tc_id)).frozen_time
             target = int(next_attempt) + int(buffer_seconds)
             if target <= cur:
                 target = cur + 1
             print(f"[advance_through_retries] advancing test clock {tc_id} to invoice.next_payment_attempt (+{buffer_seconds}s) -> {target} ({dt(target)})")
-            advance_clock(tc_id, target)
-            retrieve_triplet(sub_id)
+            advanced_at = int(time.time()) - 1
+            cur = await advance_clock(tc_id, target, cur)
+            sub = await retrieve_triplet(sub_id)
             # re-check in next iteration
             continue
 
-        # Fallback: no explicit next_attempt provided by Stripe; advance a day and retry
+        # Fallback: no explicit next_attempt provided by Stripe; back off briefly (Stripe may still be
+        # scheduling the retry), then advance a day and retry
         print("[advance_through_retries] no next_payment_attempt on invoice; falling back to +1 day advance")
-        cur = stripe.test_helpers.TestClock.retrieve(tc_id).frozen_time
-        advance_clock(tc_id, cur + 24 * 3600)
-        retrieve_triplet(sub_id)
+        await asyncio.sleep(backoff_delay(fallbacks))
+        fallbacks += 1
+        if cur is None:
+            cur = (await stripe_call(stripe.test_helpers.TestClock.retrieve, tc_id)).frozen_time
+        advanced_at = int(time.time()) - 1
+        cur = await advance_clock(tc_id, cur + 24 * 3600, cur)
+        sub = await retrieve_triplet(sub_id)
 
     print("[advance_through_retries] finished")
+    return cur
 
 
-def do_cleanup(delete: bool = True):
-    """Best-effort cleanup: remove customers with @example.com and test clocks named learn_tc_/clock_."""
+# Max concurrent deletes in do_cleanup, and the request rate they share (testmode allows ~25/s)
+CLEANUP_CONCURRENCY = 8
+CLEANUP_RPS = 20
+
+async def do_cleanup(delete: bool = True):
+    """Best-effort cleanup: remove test*@example.com experiment customers and this script's test clocks
+    (from TC_ID_CACHE, or clocks named learn_tc_/clock_ when there is no cache)."""
     print('\n[Cleanup] Removing previous test customers and test clocks...')
-    SLEEP = 0.12
-    try:
-        for cust in stripe.Customer.list(limit=100).auto_paging_iter():
-            try:
-                email = getattr(cust, 'email', None) or (cust.get('email') if hasattr(cust, 'get') else None)
-                if email and email.endswith('@example.com') and email.startswith('test'):
-                    print(f"  Found customer {cust.id} email={email}")
-                    for sub in stripe.Subscription.list(customer=cust.id).auto_paging_iter():
-                        try:
-                            if delete:
-                                stripe.Subscription.delete(sub.id)
-                                time.sleep(SLEEP)
-                                print(f"    deleted subscription {sub.id}")
-                        except Exception:
-                            pass
-                    if delete:
-                        try:
-                            stripe.Customer.delete(cust.id)
-                            time.sleep(SLEEP)
-                            print(f"    deleted customer {cust.id}")
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-    except Exception:
-        pass
 
-    try:
-        for tc in stripe.test_helpers.TestClock.list(limit=100).auto_paging_iter():
+    # Let Stripe filter customers server-side; fall back to listing everything if Search
+    # is unavailable. Test clocks come from the local id cache when it exists.
+    async def find_customers():
+        try:
+            return await list_all(stripe.Customer.search, query='metadata["learn"]:"past_due_experiment" AND email~"@example.com"', limit=100)
+        except stripe.error.StripeError as e:
+            print(f"  Customer search failed ({e}); listing all customers instead")
+            return await list_all(stripe.Customer.list, limit=100)
+
+    cached_tc_ids = load_tc_ids()
+    lookups = [find_customers()]
+    if cached_tc_ids is None:
+        lookups.append(list_all(stripe.test_helpers.TestClock.list, limit=100))
+    customers, clocks = (await asyncio.gather(*lookups, return_exceptions=True) + [[]])[:2]
+    if isinstance(customers, BaseException):
+        customers = []
+    if isinstance(clocks, BaseException):
+        clocks = []
+
+    matching = []
+    for cust in customers:
+        email = getattr(cust, 'email', None) or (cust.get('email') if hasattr(cust, 'get') else None)
+        if email and email.endswith('@example.com') and email.startswith('test'):
+            print(f"  Found customer {cust.id} email={email}")
+            matching.append(cust.id)
+
+    stale_clocks = []
+    for tc in clocks:
+        name = getattr(tc, 'name', None)
+        if name and (name.startswith('learn_tc_') or name.startswith('clock_')):
+            print(f"  Deleting test clock {tc.id} name={name}")
+            stale_clocks.append(tc.id)
+    if cached_tc_ids is not None:
+        print(f"  Deleting {len(cached_tc_ids)} test clock(s) recorded in {TC_ID_CACHE}")
+        stale_clocks = list(cached_tc_ids)
+
+    if not delete:
+        print('[Cleanup] Done.')
+        return
+
+    # Pace calls to Stripe's rate rather than sleeping after each one
+    bucket = TokenBucket(rate=CLEANUP_RPS, burst=CLEANUP_RPS)
+
+    async def _kill_customer(cust_id: str):
+        await bucket.take()
+        for sub in await list_all(stripe.Subscription.list, customer=cust_id):
+            await bucket.take()
             try:
-                name = getattr(tc, 'name', None)
-                if name and (name.startswith('learn_tc_') or name.startswith('clock_')):
-                    print(f"  Deleting test clock {tc.id} name={name}")
-                    if delete:
-                        try:
-                            stripe.test_helpers.TestClock.delete(tc.id)
-                            time.sleep(SLEEP)
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-    except Exception:
-        pass
+                await stripe_call(stripe.Subscription.delete, sub.id)
+                print(f"    deleted subscription {sub.id}")
+            except stripe.error.StripeError as e:
+                # already canceled etc.; deleting the customer below cancels it anyway
+                print(f"    could not delete subscription {sub.id}: {e}")
+        await bucket.take()
+        await stripe_call(stripe.Customer.delete, cust_id)
+        print(f"    deleted customer {cust_id}")
+
+    async def _kill_clock(tc_id: str):
+        await bucket.take()
+        try:
+            await stripe_call(stripe.test_helpers.TestClock.delete, tc_id)
+        except stripe.error.InvalidRequestError as e:
+            # already gone: fine, forget it; anything else keeps it in the cache for next time
+            if getattr(e, "code", None) != "resource_missing":
+                raise
+
+    # Fan deletions out, at most CLEANUP_CONCURRENCY in flight; failures are ignored (best-effort)
+    await gather_bounded([_kill_customer(c) for c in matching], CLEANUP_CONCURRENCY)
+    results = await gather_bounded([_kill_clock(t) for t in stale_clocks], CLEANUP_CONCURRENCY)
+    if cached_tc_ids is not None:
+        save_tc_ids([t for t, res in zip(stale_clocks, results) if isinstance(res, BaseException)])
 
     print('[Cleanup] Done.')
 
@@ -426,13 +649,15 @@ def do_cleanup(delete: bool = True):
 # Scenarios
 # ----------------------------
 
-# Use Stripe test PaymentMethod IDs to avoid sending raw card numbers to the API
-# SUCCESS_CARD = "pm_card_visa"
-# FAIL_CARD_DECLINE = "pm_card_chargeDeclined"
-SUCCESS_CARD = "tok_visa"
-FAIL_CARD_DECLINE = "tok_chargeCustomerFail"
+# Use Stripe's pre-made test PaymentMethods: no PaymentMethod.create round-trip, no raw card numbers.
+# chargeCustomerFail (unlike chargeDeclined) attaches fine and only fails when charged.
+SUCCESS_CARD = "pm_card_visa"
+FAIL_CARD_DECLINE = "pm_card_chargeCustomerFail"
 
-def run_recover(email: str, price_id: str, paid_months: int = 2, past_due_months: int = 1, total_months: int = 6, auto_advance: bool = True):
+# Max concurrent finalize/pay calls when settling historical invoices (keeps under testmode RPS)
+INVOICE_CONCURRENCY = 5
+
+async def run_recover(email: str, price_id: str, paid_months: int = 2, past_due_months: int = 1, total_months: int = 6, auto_advance: bool = True):
     """
     Plan:
     1) Create test clock & customer
@@ -453,60 +678,55 @@ def run_recover(email: str, price_id: str, paid_months: int = 2, past_due_months
     # Create test clock & customer (no reuse)
     # Use fixed baseline start time 2025-01-01 00:00:00 UTC per request
     start = int(datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc).timestamp())
-    tc = create_testclock(start)
-    cust = create_customer(email, tc.id)
-
-    # Create and attach success PM from token
-    pm_success = create_payment_method(SUCCESS_CARD)
-    attach_and_set_default_pm(cust.id, pm_success.id)
+    tc = await create_testclock(start)
+    cust = await create_customer(email, tc.id)
+    cur = tc.frozen_time  # cached clock time; advance_clock returns the new value
+
+    # Create the success and failing PMs together; attach the success PM now
+    pm_success, pm_fail = await asyncio.gather(
+        create_payment_method(SUCCESS_CARD),
+        create_payment_method(FAIL_CARD_DECLINE),
+    )
+    pm_success = await attach_and_set_default_pm(cust.id, pm_success)
 
     billing_anchor = tc.frozen_time + 5 * 60
-    sub = create_subscription_monthly(cust.id, price_id, billing_anchor)
+    sub = await create_subscription_monthly(cust.id, price_id, billing_anchor)
     sub_id = sub.id
     billing_anchor = int(getattr(sub, "billing_cycle_anchor", tc.frozen_time + 5 * 60))
 
     # Step 1: first successful payment
-    advance_clock(tc.id, billing_anchor + 60)  # 1 minute after anchor
-    retrieve_triplet(sub_id)
+    cur = await advance_clock(tc.id, billing_anchor + 60, cur)  # 1 minute after anchor
+    await retrieve_triplet(sub_id, force=True)
 
-    # Step 2: additional paid months (if any) -- use billing_anchor + 30d increments
-    # billing_anchor is absolute baseline; use 30 days ~= 1 month for test clocks
-    MONTH = 30 * 24 * 3600
+    # Step 2: additional paid months (if any) -- use billing_anchor + MONTH (30d) increments
     for i in range(1, paid_months):
-        cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-        next_cycle = next_cycle_after(billing_anchor, i, cur, MONTH)
-        advance_clock(tc.id, next_cycle)
-        retrieve_triplet(sub_id)
+        cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, i, cur), cur)
+        await retrieve_triplet(sub_id)
 
     # For recover scenario, ensure at least one past-due month
     if past_due_months <= 0:
         past_due_months = 1
 
     # Step 3: switch to failing card BEFORE next cycle
-    pm_fail = create_payment_method(FAIL_CARD_DECLINE)
-    attach_and_set_default_pm(cust.id, pm_fail.id)
+    pm_fail = await attach_and_set_default_pm(cust.id, pm_fail)
     print("\n[Action] Switched to FAIL card. Next charge should fail and enter dunning/retries.")
 
     # Step 4: advance to next billing date to trigger failure (based on billing_anchor)
     cycle_index = paid_months
-    cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-    fail_cycle = next_cycle_after(billing_anchor, cycle_index, cur, MONTH)
-    advance_clock(tc.id, fail_cycle)
-    retrieve_triplet(sub_id)
+    cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, cycle_index, cur), cur)
+    sub = await retrieve_triplet(sub_id, force=True)
 
     # Step 5: advance through retries. Use invoice-driven retry timestamps when
     # available (more robust than a fixed 4-day jump which can miss scheduled
     # retry times configured in the Dashboard).
-    advance_through_retries(tc.id, sub_id)
+    cur = await advance_through_retries(tc.id, sub_id, cur=cur, sub=sub)
 
     # Optional: keep lingering for additional months while still failing
     for j in range(past_due_months - 1):
         cycle_index += 1
-        cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-        next_cycle = next_cycle_after(billing_anchor, cycle_index, cur, MONTH)
-        advance_clock(tc.id, next_cycle)
+        cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, cycle_index, cur), cur)
         # pass retries again using invoice-driven advancement
-        advance_through_retries(tc.id, sub_id)
+        cur = await advance_through_retries(tc.id, sub_id, cur=cur)
 
     # Step 6: delay restoring success PM until just before the next billing cycle
     # so the failed month remains as past_due in history and recovery happens on the
@@ -515,58 +735,50 @@ def run_recover(email: str, price_id: str, paid_months: int = 2, past_due_months
 
     # Compute next billing cycle (the month after the failed cycle)
     cycle_index += 1
-    cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-    next_cycle = next_cycle_after(billing_anchor, cycle_index, cur, MONTH)
+    next_cycle = next_cycle_after(billing_anchor, cycle_index, cur)
 
     # Set success PM just before advancing to the next cycle so the charge will use it
-    attach_and_set_default_pm(cust.id, pm_success.id)
+    pm_success = await attach_and_set_default_pm(cust.id, pm_success)
     print("\n[Action] Switched back to SUCCESS card right before next billing cycle.")
 
     # Immediately attempt to finalize and pay any historical draft/open invoices
-    try:
-        print("[Action] Finalizing and paying historical open/draft invoices for customer")
-        try:
-            invoices = stripe.Invoice.list(customer=cust.id)
-        except Exception:
-            invoices = []
-        for inv in invoices.auto_paging_iter():
-            st = inv.get('status') if hasattr(inv, 'get') else getattr(inv, 'status', None)
-            if st == 'draft':
-                try:
-                    stripe.Invoice.finalize_invoice(inv.id)
-                    time.sleep(0.2)
-                except Exception:
-                    pass
-            # re-retrieve status
-            try:
-                inv2 = stripe.Invoice.retrieve(inv.id)
-                st2 = inv2.get('status') if hasattr(inv2, 'get') else getattr(inv2, 'status', None)
-            except Exception:
-                st2 = st
-            if st2 in ('open', 'draft'):
-                try:
-                    stripe.Invoice.pay(inv.id)
-                    print(f"  Paid invoice {inv.id} status={st2}")
-                except Exception as e:
-                    print(f"  Warning: could not pay invoice {inv.id}: {e}")
-    except Exception:
-        pass
+    print("[Action] Finalizing and paying historical open/draft invoices for customer")
+    # Filter by status server-side; the listed status is trusted, so no per-invoice re-retrieve
+    listed = await asyncio.gather(
+        list_all(stripe.Invoice.list, customer=cust.id, status="draft", limit=100),
+        list_all(stripe.Invoice.list, customer=cust.id, status="open", limit=100),
+        return_exceptions=True,
+    )
+    for status, l in zip(("draft", "open"), listed):
+        if isinstance(l, BaseException):
+            print(f"  Warning: could not list {status} invoices: {l}")
+    drafts, opens = [[] if isinstance(l, BaseException) else [inv.id for inv in l] for l in listed]
+
+    # finalize drafts, then pay drafts + opens, with at most INVOICE_CONCURRENCY calls in flight
+    finalized = await gather_bounded([stripe_call(stripe.Invoice.finalize_invoice, iid) for iid in drafts], INVOICE_CONCURRENCY)
+    for iid, res in zip(drafts, finalized):
+        if isinstance(res, BaseException):
+            print(f"  Warning: could not finalize invoice {iid}: {res}")
+    to_pay = [(iid, "draft") for iid in drafts] + [(iid, "open") for iid in opens]
+    results = await gather_bounded([stripe_call(stripe.Invoice.pay, iid) for iid, _ in to_pay], INVOICE_CONCURRENCY)
+    for (iid, st), res in zip(to_pay, results):
+        if isinstance(res, BaseException):
+            print(f"  Warning: could not pay invoice {iid}: {res}")
+        else:
+            print(f"  Paid invoice {iid} status={st}")
 
     # Advance to next billing cycle to trigger recovery charge
-    advance_clock(tc.id, next_cycle)
-    retrieve_triplet(sub_id)
+    cur = await advance_clock(tc.id, next_cycle, cur)
+    await retrieve_triplet(sub_id, force=True)
 
     # After recovery, optionally continue advancing months so total simulated months == total_months
     # months simulated so far = paid_months + past_due_months + 1 (recovery month)
     months_done = int(paid_months) + int(past_due_months) + 1
-    MONTH = 30 * 24 * 3600
     cycle_index_local = cycle_index + 1  # cycle_index currently points to the recovery cycle we've just advanced to
     while months_done < int(total_months):
         # advance to next month (paid)
-        cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-        next_cycle2 = next_cycle_after(billing_anchor, cycle_index_local, cur, MONTH)
-        advance_clock(tc.id, next_cycle2)
-        retrieve_triplet(sub_id)
+        cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, cycle_index_local, cur), cur)
+        await retrieve_triplet(sub_id)
         months_done += 1
         cycle_index_local += 1
 
@@ -578,16 +790,15 @@ def run_recover(email: str, price_id: str, paid_months: int = 2, past_due_months
     # Auto-advance this scenario's test clock by +2 days to help finalize invoices
     if auto_advance:
         try:
-            cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
             extra = 2 * 24 * 3600  # 2 days in seconds
             print(f"\n[Auto Advance] Advancing test clock {tc.id} by +2 days ({extra} seconds) to help finalize any pending invoices.")
-            advance_clock(tc.id, cur + extra)
+            await advance_clock(tc.id, cur + extra, cur)
         except Exception as e:
             print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
 
     return {"customer": cust.id, "subscription": sub_id, "test_clock": tc.id}
 
-def run_linger(email: str, price_id: str, paid_months: int = 2, total_months: int = 6, auto_advance: bool = True):
+async def run_linger(email: str, price_id: str, paid_months: int = 2, total_months: int = 6, auto_advance: bool = True):
     """
     Similar to recover, but once it becomes past_due, we keep failing and never switch back.
     """
@@ -598,54 +809,50 @@ def run_linger(email: str, price_id: str, paid_months: int = 2, total_months: in
     # TestClock & Customer (always create new)
     # Use fixed baseline start time 2025-01-01 00:00:00 UTC per request
     start = int(datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc).timestamp())
-    tc = create_testclock(start)
-    cust = create_customer(email, tc.id)
+    tc = await create_testclock(start)
+    cust = await create_customer(email, tc.id)
+    cur = tc.frozen_time  # cached clock time; advance_clock returns the new value
 
-    pm_success = create_payment_method(SUCCESS_CARD)
-    attach_and_set_default_pm(cust.id, pm_success.id)
+    pm_success, pm_fail = await asyncio.gather(
+        create_payment_method(SUCCESS_CARD),
+        create_payment_method(FAIL_CARD_DECLINE),
+    )
+    pm_success = await attach_and_set_default_pm(cust.id, pm_success)
 
     billing_anchor = tc.frozen_time + 5 * 60
-    sub = create_subscription_monthly(cust.id, price_id, billing_anchor)
+    sub = await create_subscription_monthly(cust.id, price_id, billing_anchor)
     sub_id = sub.id
     billing_anchor = int(getattr(sub, "billing_cycle_anchor", tc.frozen_time + 5 * 60))
 
     # First successful payment
-    advance_clock(tc.id, billing_anchor + 60)
-    retrieve_triplet(sub_id)
+    cur = await advance_clock(tc.id, billing_anchor + 60, cur)
+    await retrieve_triplet(sub_id, force=True)
 
     # Additional paid months
-    MONTH = 30 * 24 * 3600
     for i in range(1, paid_months):
-        cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-        next_cycle = next_cycle_after(billing_anchor, i, cur, MONTH)
-        advance_clock(tc.id, next_cycle)
-        retrieve_triplet(sub_id)
-
-    # Switch to failing: attach failing PM from token
-    pm_fail = create_payment_method(FAIL_CARD_DECLINE)
-    attach_and_set_default_pm(cust.id, pm_fail.id)
+        cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, i, cur), cur)
+        await retrieve_triplet(sub_id)
+
+    # Switch to failing: attach failing PM (prepared up front)
+    pm_fail = await attach_and_set_default_pm(cust.id, pm_fail)
     print("\n[Action] Switched to FAIL card. Will linger past_due.")
 
     # Trigger failure at next billing date (based on billing_anchor)
     cycle_index = paid_months
-    cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-    fail_cycle = next_cycle_after(billing_anchor, cycle_index, cur, MONTH)
-    advance_clock(tc.id, fail_cycle)
-    retrieve_triplet(sub_id)
+    cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, cycle_index, cur), cur)
+    sub = await retrieve_triplet(sub_id, force=True)
 
     # Pass retries to reach past_due (use invoice-driven advancement)
-    advance_through_retries(tc.id, sub_id)
+    cur = await advance_through_retries(tc.id, sub_id, cur=cur, sub=sub)
 
     # Linger for remaining cycles until total_months is reached.
     # months_done counts months simulated so far: paid_months paid + 1 failed month
     months_done = int(paid_months) + 1
     while months_done < int(total_months):
         cycle_index += 1
-        cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
-        next_cycle = next_cycle_after(billing_anchor, cycle_index, cur, MONTH)
-        advance_clock(tc.id, next_cycle)
+        cur = await advance_clock(tc.id, next_cycle_after(billing_anchor, cycle_index, cur), cur)
         # run retries for the failed cycle (invoice-driven)
-        advance_through_retries(tc.id, sub_id)
+        cur = await advance_through_retries(tc.id, sub_id, cur=cur)
         months_done += 1
 
     print("\n[Done] LINGER scenario created.")
@@ -656,10 +863,9 @@ def run_linger(email: str, price_id: str, paid_months: int = 2, total_months: in
     # Auto-advance this scenario's test clock by +2 days to help finalize invoices
     if auto_advance:
         try:
-            cur = stripe.test_helpers.TestClock.retrieve(tc.id).frozen_time
             extra = 2 * 24 * 3600  # 2 days
             print(f"\n[Auto Advance] Advancing test clock {tc.id} by +2 days ({extra} seconds) to help finalize any pending invoices.")
-            advance_clock(tc.id, cur + extra)
+            await advance_clock(tc.id, cur + extra, cur)
         except Exception as e:
             print(f"[Warning] Could not auto-advance test clock {tc.id}: {e}")
 
@@ -669,7 +875,7 @@ def run_linger(email: str, price_id: str, paid_months: int = 2, total_months: in
 # Main
 # ----------------------------
 
-def main():
+async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--scenario", choices=["recover", "linger"], required=True)
     parser.add_argument("--email", required=False, default="test1@example.com", help="customer email, e.g. learn_recover_001@example.com (ignored in --count batch mode)")
@@ -680,21 +886,31 @@ def main():
     # Batch options (when creating multiple recover users)
     parser.add_argument("--count", type=int, default=0, help="If >0, create this many users instead of a single --email")
     parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible paid/past_due sampling when --count>0")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of batch scenarios to run in parallel when --count>0")
     parser.add_argument("--email-prefix", type=str, default="test", help="Prefix for generated emails when --count>0 (emails: <prefix>1@example.com)")
     parser.add_argument("--min-paid", type=int, default=1, help="min paid_months when sampling for batch")
     parser.add_argument("--max-paid", type=int, default=3, help="max paid_months when sampling for batch")
     parser.add_argument("--min-past-due", type=int, default=0, help="min past_due_months when sampling for batch")
     parser.add_argument("--max-past-due", type=int, default=2, help="max past_due_months when sampling for batch")
     parser.add_argument("--total-months", type=int, default=6, help="Total months to simulate per customer (paid + past_due + recovery + extra paid months)")
+    parser.add_argument("--verbose", action="store_true", help="Log subscription/invoice/PI state after every clock advance (one extra retrieve each)")
     # No reuse options: the script always creates new test clock/customer and uses built-in tokens
     args = parser.parse_args()
 
+    global VERBOSE
+    VERBOSE = args.verbose
+
     stripe.api_key = must_env("STRIPE_SECRET_KEY")
     price_id = must_env("PRICE_ID")
+    configure_http_client()
+
+    # Seed once up front so backoff jitter is reproducible (batch plans use per-customer RNGs)
+    if args.seed is not None:
+        random.seed(args.seed)
 
     if getattr(args, 'cleanup', False):
         try:
-            do_cleanup(delete=True)
+            await do_cleanup(delete=True)
         except Exception as e:
             print(f"[Warning] cleanup failed: {e}")
 
@@ -702,33 +918,37 @@ def main():
 
     # Batch mode: create many customers when --count>0
     if getattr(args, 'count', 0) and args.count > 0:
-        if args.seed is not None:
-            random.seed(args.seed)
+        print(f"Batch mode: creating {args.count} customers with prefix '{args.email_prefix}' for scenario {args.scenario} (concurrency={args.concurrency})")
 
-        print(f"Batch mode: creating {args.count} customers with prefix '{args.email_prefix}' for scenario {args.scenario}")
-        for i in range(1, args.count + 1):
-            paid = random.randint(args.min_paid, args.max_paid)
+        async def one(i: int):
+            # Each scenario owns its clock/customer/subscription, so they run independently;
+            # a per-customer RNG keeps the sampled plan reproducible regardless of scheduling.
+            rng = random.Random(f"{args.seed}:{i}") if args.seed is not None else random.Random()
+            paid = rng.randint(args.min_paid, args.max_paid)
             # email_i = f"{args.email_prefix}{i}@example.com"
             email_i = f"{args.email_prefix}{i}@actual.com"
             if args.scenario == 'recover':
                 # ensure at least 1 past_due for recover
                 max_pd = max(1, args.max_past_due)
                 min_pd = max(1, args.min_past_due)
-                past_due = random.randint(min_pd, max_pd)
+                past_due = rng.randint(min_pd, max_pd)
                 print(f"\n[Batch] ({i}/{args.count}) email={email_i} paid_months={paid} past_due_months={past_due}")
-                res = run_recover(email_i, price_id, paid_months=paid, past_due_months=past_due, total_months=args.total_months)
-                result = res
+                return await run_recover(email_i, price_id, paid_months=paid, past_due_months=past_due, total_months=args.total_months)
+            # For linger batch mode: sample paid months, then linger until total_months
+            print(f"\n[Batch] ({i}/{args.count}) email={email_i} paid_months={paid} total_months={args.total_months} (linger)")
+            return await run_linger(email_i, price_id, paid_months=paid, total_months=args.total_months)
+
+        results = await gather_bounded([one(i) for i in range(1, args.count + 1)], max(1, args.concurrency))
+        for i, res in enumerate(results, start=1):
+            if isinstance(res, BaseException):
+                print(f"[Batch] ({i}/{args.count}) failed: {res}")
             else:
-                # For linger batch mode: sample paid months, then linger until total_months
-                print(f"\n[Batch] ({i}/{args.count}) email={email_i} paid_months={paid} total_months={args.total_months} (linger)")
-                res = run_linger(email_i, price_id, paid_months=paid, total_months=args.total_months)
                 result = res
-            time.sleep(0.2)
     else:
         if args.scenario == "recover":
             # enforce at least 1 past_due for recover
             pd = args.past_due_months if args.past_due_months and args.past_due_months > 0 else 1
-            result = run_recover(
+            result = await run_recover(
                 args.email,
                 price_id,
                 paid_months=args.paid_months,
@@ -736,7 +956,7 @@ def main():
                 total_months=args.total_months,
             )
         else:
-            result = run_linger(
+            result = await run_linger(
                 args.email,
                 price_id,
                 paid_months=args.paid_months,
@@ -746,4 +966,4 @@ def main():
     # No global auto-advance here; each scenario advances its own test clock by +2 days.
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
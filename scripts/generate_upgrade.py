@@ -17,9 +17,14 @@ Notes:
 """
 
 import os
+import re
+import json
 import time
 import random
 import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 
 import stripe
@@ -27,13 +32,148 @@ import stripe
 # Config
 DEFAULT_CUSTOMER_COUNT = 10
 DEFAULT_MONTHS = 6
-SLEEP_BETWEEN_CALLS = 0.12
+DEFAULT_WORKERS = 16
+CREATED_PATH = 'generated_upgrade_customers.jsonl'
+
+# KEY=value lines of a .env file; the value may be wrapped in single or double quotes
+DOTENV_RE = re.compile(r'''^[ \t]*([A-Za-z_]\w*)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|([^\n]*?))[ \t]*\r?$''', re.M)
 
 # Provided by user (can be overridden via env)
 BASE_PRICE_ID = os.environ.get('BASE_PRICE_ID') or 'price_1Sv8ZRBJL1dlpEW5iWg9KHV0'
 UPGRADE_PRICE_ID = os.environ.get('UPGRADE_PRICE_ID') or 'price_1SvplkBJL1dlpEW5Xx6cS9ll'
 
 
+class AIMDLimiter:
+    """Caps in-flight Stripe requests with an additive-increase / multiplicative-decrease window.
+
+    Each success grows the window by `alpha / limit` (about +alpha per full window of requests);
+    each 429/5xx multiplies it by `beta`. Callers block in acquire() while the window is full.
+    """
+
+    def __init__(self, initial=4.0, min_limit=1.0, max_limit=64.0, alpha=0.5, beta=0.5):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.alpha = alpha
+        self.beta = beta
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.beta)
+            else:
+                self.limit = min(self.max_limit, self.limit + self.alpha / self.limit)
+            self._cond.notify_all()
+
+
+LIMITER = AIMDLimiter()
+CALL_MAX_ATTEMPTS = 5
+BACKOFF_CAP = 30.0
+# SDK methods that only read; anything else passed to call() is a write (POST/DELETE)
+READ_METHODS = {'retrieve', 'list', 'search'}
+
+
+def _is_throttle(e):
+    if isinstance(e, stripe.error.RateLimitError):
+        return True
+    status = getattr(e, 'http_status', None)
+    return isinstance(e, stripe.error.StripeError) and status is not None and status >= 500
+
+
+def _is_retryable(e, fn, kwargs):
+    """Whether replaying this failed call is safe.
+
+    429s were rejected before running, so they always are. A 5xx may have been applied
+    already, so it is only replayed for reads (or when Stripe says Stripe-Should-Retry: true);
+    a keyed write would just get its stored 5xx back, an unkeyed one might run twice.
+    A connection error (timeout, reset: the response was lost) is replayed for reads and for
+    writes that carry an idempotency_key, where Stripe returns the original result if the
+    first attempt did go through.
+    """
+    headers = getattr(e, 'headers', None) or {}
+    should_retry = headers.get('Stripe-Should-Retry')
+    if should_retry == 'false':
+        return False
+    if isinstance(e, stripe.error.RateLimitError) or should_retry == 'true':
+        return True
+    is_read = getattr(fn, '__name__', '') in READ_METHODS
+    if isinstance(e, stripe.error.APIConnectionError):
+        return is_read or bool(kwargs.get('idempotency_key'))
+    return _is_throttle(e) and is_read
+
+
+def _retry_delay(e, attempt):
+    """Server's Retry-After when present, else full jitter: uniform(0, min(2**attempt, BACKOFF_CAP))."""
+    headers = getattr(e, 'headers', None) or {}
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        if value is not None:
+            return float(value) + random.uniform(0, 0.25)
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(0, min(2 ** attempt, BACKOFF_CAP))
+
+
+def call(fn, *args, **kwargs):
+    """Invoke a Stripe SDK function through the shared AIMD limiter.
+
+    Rate-limited (429) and server (5xx) errors shrink the window; the ones that are safe to
+    replay (see _is_retryable) are retried with backoff, everything else is raised unchanged.
+    """
+    for attempt in range(CALL_MAX_ATTEMPTS):
+        LIMITER.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            LIMITER.release(throttled=_is_throttle(e))
+            if attempt == CALL_MAX_ATTEMPTS - 1 or not _is_retryable(e, fn, kwargs):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            continue
+        LIMITER.release()
+        return result
+
+
+def list_all(fn, **params):
+    """Drain a Stripe list endpoint page by page (starting_after cursor), each page its own call()."""
+    out = []
+    while True:
+        page = call(fn, **params)
+        data = page.get('data') or []
+        out.extend(data)
+        if not page.get('has_more') or not data:
+            return out
+        params = {**params, 'starting_after': data[-1]['id']}
+
+
+@functools.lru_cache(maxsize=256)
+def _get_price(price_id):
+    """Price.retrieve, once per price id per process (every customer shares the same two prices)."""
+    return call(stripe.Price.retrieve, price_id)
+
+
+def _subscription_item_id(sub):
+    """Id of the subscription's first item, or None.
+
+    Reads sub['items'] by key: on a StripeObject (a dict subclass) `sub.items` is dict.items, not the list.
+    """
+    try:
+        items = sub['items'] if 'items' in sub else None
+        data = items['data'] if items and 'data' in items else None
+        return data[0]['id'] if data else None
+    except (TypeError, KeyError, IndexError):
+        return None
+
+
 def ts(dt: datetime) -> int:
     return int(dt.timestamp())
 
@@ -43,63 +183,62 @@ def _load_dotenv(path: str = ".env") -> None:
         return
     try:
         with open(path, "r", encoding="utf-8") as fh:
-            for ln in fh:
-                ln = ln.strip()
-                if not ln or ln.startswith("#") or "=" not in ln:
-                    continue
-                k, v = ln.split("=", 1)
-                k = k.strip()
-                v = v.strip().strip('"').strip("'")
-                if k and k not in os.environ:
-                    os.environ[k] = v
+            txt = fh.read()
     except Exception:
-        pass
+        return
+    found = {}
+    for k, dq, sq, bare in DOTENV_RE.findall(txt):
+        if k not in os.environ and k not in found:  # first assignment wins, as before
+            found[k] = dq or sq or bare
+    os.environ.update(found)
 
 
 def create_test_clock(stripe_module, frozen_time, name):
     try:
-        tc = stripe_module.test_helpers.TestClock.create(frozen_time=frozen_time, name=name)
+        tc = call(stripe_module.test_helpers.TestClock.create, frozen_time=frozen_time, name=name)
     except Exception:
-        tc = stripe_module.test_helpers.test_clock.create(frozen_time=frozen_time, name=name)
+        tc = call(stripe_module.test_helpers.test_clock.create, frozen_time=frozen_time, name=name)
     return tc
 
 
 def advance_test_clock(stripe_module, clock_id, frozen_time):
-    # Retrieve current clock frozen_time and ensure new frozen_time is strictly greater
-    try:
-        tc = stripe_module.test_helpers.TestClock.retrieve(clock_id)
-        cur = getattr(tc, 'frozen_time', None) or (tc.get('frozen_time') if hasattr(tc, 'get') else None)
-    except Exception:
-        cur = None
-
-    if cur is not None and frozen_time <= cur:
-        frozen_time = cur + 1
-
+    # Advance optimistically; only if Stripe rejects frozen_time (must be strictly greater than the
+    # clock's current time) do we retrieve the clock and retry at cur + 1.
     max_advance_attempts = 8
     backoff = 0.5
     advanced = False
+    bumped = False
     for attempt in range(max_advance_attempts):
         try:
-            stripe_module.test_helpers.TestClock.advance(clock_id, frozen_time=frozen_time)
+            # throttling is retried (and the window shrunk) inside call(); this loop covers the rest
+            call(stripe_module.test_helpers.TestClock.advance, clock_id, frozen_time=frozen_time)
             advanced = True
             break
-        except stripe.error.RateLimitError:
-            time.sleep(backoff)
-            backoff = min(backoff * 1.5, 5.0)
-            continue
+        except stripe.error.InvalidRequestError as e:
+            if not bumped and 'frozen_time' in str(e):
+                bumped = True
+                try:
+                    tc = call(stripe_module.test_helpers.TestClock.retrieve, clock_id)
+                    cur = getattr(tc, 'frozen_time', None) or (tc.get('frozen_time') if hasattr(tc, 'get') else None)
+                except Exception:
+                    cur = None
+                if cur is not None and frozen_time <= cur:
+                    frozen_time = cur + 1
+                    continue
         except Exception:
-            time.sleep(backoff)
-            backoff = min(backoff * 1.5, 5.0)
-            continue
+            pass
+        time.sleep(backoff)
+        backoff = min(backoff * 1.5, 5.0)
 
     if not advanced:
         raise RuntimeError(f'Failed to advance test clock {clock_id} after {max_advance_attempts} attempts')
 
     timeout = 60
     start = time.time()
+    poll = 0.2
     while True:
         try:
-            tc2 = stripe_module.test_helpers.TestClock.retrieve(clock_id)
+            tc2 = call(stripe_module.test_helpers.TestClock.retrieve, clock_id)
             status = getattr(tc2, 'status', None) or (tc2.get('status') if hasattr(tc2, 'get') else None)
             new_frozen = getattr(tc2, 'frozen_time', None) or (tc2.get('frozen_time') if hasattr(tc2, 'get') else None)
             if status == 'ready' and (new_frozen is None or new_frozen >= frozen_time):
@@ -108,7 +247,132 @@ def advance_test_clock(stripe_module, clock_id, frozen_time):
             pass
         if time.time() - start > timeout:
             raise TimeoutError(f'TestClock {clock_id} not ready after {timeout}s (requested frozen_time={frozen_time})')
-        time.sleep(1)
+        # small advances are usually ready within a second; back off 0.2, 0.4, 0.8, ... capped at 5s
+        time.sleep(poll)
+        poll = min(poll * 2, 5.0)
+
+
+def create_one(i, creation_ts, upgrade_after):
+    """Create test clock, customer, card and base subscription for customer number i (0-based)."""
+    # email = f'upgrade{i+1}@example.com'
+    email = f'upgrade{i+1}@actual.com'
+    name = f'Upgrade Test {i+1}'
+
+    clock_name = f'clock_{i+1}_{int(time.time())}'
+    tc = create_test_clock(stripe, frozen_time=creation_ts, name=clock_name)
+
+    customer = call(stripe.Customer.create, email=email, name=name, test_clock=tc.id)
+
+    # attach working payment method
+    try:
+        card = call(stripe.Customer.create_source, customer.id, source='tok_visa')
+        try:
+            call(stripe.Customer.modify, customer.id, default_source=card.id)
+        except Exception:
+            pass
+    except Exception:
+        pass
+
+    # create subscription on base price (throttling/5xx are already retried with backoff inside call())
+    sub = call(stripe.Subscription.create, customer=customer.id, items=[{'price': BASE_PRICE_ID}], expand=['latest_invoice', 'items'])
+    sub_item_id = _subscription_item_id(sub)
+
+    return {
+        'index': i,
+        'email': email,
+        'customer_id': customer.id,
+        'tc_id': tc.id,
+        'sub_id': sub.id,
+        'sub_item_id': sub_item_id,
+        'upgrade_after': upgrade_after,
+    }
+
+
+def load_created(path):
+    """Records from a previous (possibly interrupted) run, keyed by customer index; the last line per index wins."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as fh:
+        for ln in fh:
+            try:
+                rec = json.loads(ln)
+                done[rec['index']] = rec
+            except (ValueError, KeyError, TypeError):
+                continue  # torn last line from a crash
+    return done
+
+
+def advance_and_pay(rec, month, current_dt):
+    """Advance one customer's clock for `month`, upgrade if scheduled, and pay open/draft invoices.
+
+    Returns (upgrades, invoices_paid) so the caller can total them without sharing state across threads.
+    """
+    current_ts = ts(current_dt)
+    upgraded = 0
+    paid = 0
+
+    # Advance to start-of-month by default; if this customer upgrades this month,
+    # advance to mid-month (+15 days) before performing the upgrade to make it more visible.
+    try:
+        if month == rec['upgrade_after']:
+            mid_dt = current_dt + timedelta(days=15)
+            target_ts = ts(mid_dt)
+        else:
+            target_ts = current_ts
+        advance_test_clock(stripe, rec['tc_id'], frozen_time=target_ts)
+    except Exception as e:
+        print(f'  Warning: could not advance clock for {rec["email"]}: {e}')
+
+    # perform upgrade on the scheduled month
+    if month == rec['upgrade_after']:
+        try:
+            # One idempotency key per request: if a modify/create succeeded but its response was lost
+            # (APIConnectionError), call() retries with the same key and Stripe replays the stored
+            # result instead of applying it a second time.
+            ikey = f"upgrade-{rec['sub_id']}-{month}"
+            # Preferred: update the existing subscription item to the upgrade price (no double billing)
+            if rec.get('sub_item_id'):
+                call(stripe.Subscription.modify,
+                    rec['sub_id'],
+                    items=[{'id': rec['sub_item_id'], 'price': UPGRADE_PRICE_ID}],
+                    proration_behavior='none',
+                    idempotency_key=f'{ikey}-swap'
+                )
+            else:
+                # No subscription item id: create a fresh subscription with the upgrade price
+                # Cancel any existing subscription id to avoid double billing
+                try:
+                    call(stripe.Subscription.delete, rec['sub_id'], idempotency_key=f'{ikey}-delete')
+                except Exception:
+                    try:
+                        call(stripe.Subscription.modify, rec['sub_id'], cancel_at_period_end=True,
+                             idempotency_key=f'{ikey}-cancel')
+                    except Exception:
+                        pass
+                call(stripe.Subscription.create, customer=rec['customer_id'], items=[{'price': UPGRADE_PRICE_ID}],
+                     idempotency_key=f'{ikey}-create')
+
+            upgraded = 1
+            print(f'  Upgraded {rec["email"]} to upgrade price at month {month+1}')
+        except Exception as e:
+            print(f'  Warning: failed to upgrade {rec["email"]}: {e}')
+
+    # pay any open/draft invoices; Stripe filters by status, so paid history (one more invoice every
+    # month) is never listed
+    for status in ('open', 'draft'):
+        try:
+            invs = list_all(stripe.Invoice.list, customer=rec['customer_id'], status=status, limit=100)
+        except Exception:
+            continue
+        for inv in invs:
+            try:
+                call(stripe.Invoice.pay, inv.id)
+                paid += 1
+            except Exception:
+                pass
+
+    return upgraded, paid
 
 
 def main():
@@ -117,6 +381,10 @@ def main():
     parser.add_argument('--months', type=int, default=DEFAULT_MONTHS, help='Months of history to simulate')
     parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible results')
     parser.add_argument('--cleanup', action='store_true', help='(Optional) delete previous test data matching pattern')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Customers created in parallel')
+    parser.add_argument('--resume', action='store_true',
+                        help=f'Reuse customers already recorded in {CREATED_PATH}, create only the missing ones '
+                             'and continue each from its last simulated month')
     args = parser.parse_args()
 
     _load_dotenv()
@@ -134,8 +402,8 @@ def main():
 
     # Validate price ids quickly
     try:
-        _ = stripe.Price.retrieve(BASE_PRICE_ID)
-        _ = stripe.Price.retrieve(UPGRADE_PRICE_ID)
+        _ = _get_price(BASE_PRICE_ID)
+        _ = _get_price(UPGRADE_PRICE_ID)
     except Exception as e:
         print('Warning: could not retrieve provided price ids from Stripe. Proceeding anyway. Error:', e)
 
@@ -150,168 +418,66 @@ def main():
 
     print(f'Creating {total} customers in {creation_dt.isoformat()} and simulating {args.months} months')
 
-    for i in range(total):
-        # email = f'upgrade{i+1}@example.com'
-        email = f'upgrade{i+1}@actual.com'
-        name = f'Upgrade Test {i+1}'
-
-        clock_name = f'clock_{i+1}_{int(time.time())}'
-        tc = create_test_clock(stripe, frozen_time=creation_ts, name=clock_name)
-        time.sleep(SLEEP_BETWEEN_CALLS)
-
-        customer = stripe.Customer.create(email=email, name=name, test_clock=tc.id)
-        time.sleep(SLEEP_BETWEEN_CALLS)
-
-        # attach working payment method
-        try:
-            card = stripe.Customer.create_source(customer.id, source='tok_visa')
-            time.sleep(SLEEP_BETWEEN_CALLS)
-            try:
-                stripe.Customer.modify(customer.id, default_source=card.id)
-                time.sleep(SLEEP_BETWEEN_CALLS)
-            except Exception:
-                pass
-        except Exception:
-            pass
-
-        # create subscription on base price
-        try:
-            sub = stripe.Subscription.create(customer=customer.id, items=[{'price': BASE_PRICE_ID}], expand=['latest_invoice', 'items'])
-            time.sleep(SLEEP_BETWEEN_CALLS)
-        except Exception:
-            sub = stripe.Subscription.create(customer=customer.id, items=[{'price': BASE_PRICE_ID}], expand=['latest_invoice', 'items'])
-            time.sleep(SLEEP_BETWEEN_CALLS)
-
-        # try to find subscription item id
-        sub_item_id = None
-        try:
-            items = getattr(sub, 'items', None) or (sub.get('items') if hasattr(sub, 'get') else None)
-            if items:
-                data = getattr(items, 'data', None) or (items.get('data') if hasattr(items, 'get') else None)
-                if data and len(data) > 0:
-                    sub_item_id = data[0].id if hasattr(data[0], 'id') else (data[0].get('id') if isinstance(data[0], dict) else None)
-        except Exception:
-            pass
-
-        # pick upgrade month offset after 1-4 paid months
-        upgrade_after = random.randint(1, 4)
-
-        created.append({
-            'email': email,
-            'customer_id': customer.id,
-            'tc_id': tc.id,
-            'sub_id': sub.id,
-            'sub_item_id': sub_item_id,
-            'upgrade_after': upgrade_after,
-        })
-
-        summary['created_customers'] += 1
-
-        print(f'  Created {email} (cust={customer.id}) -> will upgrade after {upgrade_after} month(s)')
-
-    # Simulate months 0 .. months-1
-    for month in range(args.months):
-        current_dt = (start + timedelta(days=30 * month)).replace(hour=0, minute=0, second=0, microsecond=0)
-        current_ts = ts(current_dt)
-        print(f'--- Simulating month {month+1}/{args.months} ({current_dt.date()}) ---')
-
-        for rec in created:
-            # Advance to start-of-month by default; if this customer upgrades this month,
-            # advance to mid-month (+15 days) before performing the upgrade to make it more visible.
-            try:
-                if month == rec['upgrade_after']:
-                    mid_dt = current_dt + timedelta(days=15)
-                    target_ts = ts(mid_dt)
-                else:
-                    target_ts = current_ts
-                advance_test_clock(stripe, rec['tc_id'], frozen_time=target_ts)
-            except Exception as e:
-                print(f'  Warning: could not advance clock for {rec["email"]}: {e}')
-            time.sleep(SLEEP_BETWEEN_CALLS)
-
-            # perform upgrade on the scheduled month
-            if month == rec['upgrade_after']:
+    # draw upgrade months up front so the result for a given --seed does not depend on thread timing
+    upgrade_afters = [random.randint(1, 4) for _ in range(total)]
+    by_index = load_created(CREATED_PATH) if args.resume else {}
+    if by_index:
+        print(f'  Resuming: {len(by_index)} customers already recorded in {CREATED_PATH}')
+
+    # Each record is appended (one JSON object per line) as soon as it exists, and appended again
+    # with its new 'months_done' after every simulated month (the last line per index wins, see
+    # load_created), so an interrupted run keeps everything so far and --resume continues each
+    # clock from where it stopped. Only the main thread writes to the file.
+    failures = []
+    with open(CREATED_PATH, 'a' if args.resume else 'w', encoding='utf-8', buffering=1) as created_fh:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+            futures = {ex.submit(create_one, i, creation_ts, upgrade_afters[i]): i
+                       for i in range(total) if i not in by_index}
+            for fut in as_completed(futures):
+                i = futures[fut]
                 try:
-                    # Preferred: update the existing subscription item to the upgrade price (no double billing)
-                    if rec.get('sub_item_id'):
-                        try:
-                            stripe.Subscription.modify(
-                                rec['sub_id'],
-                                items=[{'id': rec['sub_item_id'], 'price': UPGRADE_PRICE_ID}],
-                                proration_behavior='none'
-                            )
-                        except Exception:
-                            # If updating the item fails, try deleting the old item and adding the new price
-                            try:
-                                stripe.Subscription.modify(
-                                    rec['sub_id'],
-                                    items=[
-                                        {'id': rec['sub_item_id'], 'deleted': True},
-                                        {'price': UPGRADE_PRICE_ID}
-                                    ],
-                                    proration_behavior='none'
-                                )
-                            except Exception:
-                                # Last resort: remove the old subscription (delete if possible) then create a new one
-                                try:
-                                    stripe.Subscription.delete(rec['sub_id'])
-                                except Exception:
-                                    try:
-                                        stripe.Subscription.modify(rec['sub_id'], cancel_at_period_end=True)
-                                    except Exception:
-                                        pass
-                                try:
-                                    stripe.Subscription.create(customer=rec['customer_id'], items=[{'price': UPGRADE_PRICE_ID}])
-                                except Exception:
-                                    pass
-                    else:
-                        # No subscription item id: create a fresh subscription with the upgrade price
-                        try:
-                            # Cancel any existing subscription id to avoid double billing
-                            try:
-                                stripe.Subscription.delete(rec['sub_id'])
-                            except Exception:
-                                try:
-                                    stripe.Subscription.modify(rec['sub_id'], cancel_at_period_end=True)
-                                except Exception:
-                                    pass
-                            stripe.Subscription.create(customer=rec['customer_id'], items=[{'price': UPGRADE_PRICE_ID}])
-                        except Exception:
-                            pass
-
-                    summary['upgrades'] += 1
-                    print(f'  Upgraded {rec["email"]} to upgrade price at month {month+1}')
+                    rec = fut.result()
                 except Exception as e:
-                    print(f'  Warning: failed to upgrade {rec["email"]}: {e}')
-
-            # pay any open/draft invoices
-            try:
-                invs = stripe.Invoice.list(customer=rec['customer_id'])
-                for inv in invs.auto_paging_iter():
-                    st = getattr(inv, 'status', None) or (inv.get('status') if hasattr(inv, 'get') else None)
-                    if st in ('open', 'draft'):
-                        try:
-                            stripe.Invoice.pay(inv.id)
-                            summary['invoices_paid'] += 1
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-
-            time.sleep(0.05)
+                    failures.append((f'create #{i+1}', e))
+                    continue
+                rec['months_done'] = 0
+                by_index[i] = rec
+                created_fh.write(json.dumps(rec) + '\n')
+                summary['created_customers'] += 1
+                print(f'  Created {rec["email"]} (cust={rec["customer_id"]}) -> will upgrade after {rec["upgrade_after"]} month(s)')
+        created.extend(by_index[i] for i in range(total) if i in by_index)
+        print(f'Wrote {summary["created_customers"]} created customers to {CREATED_PATH}')
+
+        # Simulate months 0 .. months-1
+        for month in range(args.months):
+            current_dt = (start + timedelta(days=30 * month)).replace(hour=0, minute=0, second=0, microsecond=0)
+            # exactly this month: a customer whose month failed stops here (--resume picks it up)
+            pending = [rec for rec in created if rec.get('months_done', 0) == month]
+            if not pending:
+                continue
+            print(f'--- Simulating month {month+1}/{args.months} ({current_dt.date()}) ---')
+
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+                futures = {ex.submit(advance_and_pay, rec, month, current_dt): rec for rec in pending}
+                for fut in as_completed(futures):
+                    rec = futures[fut]
+                    try:
+                        upgraded, paid = fut.result()
+                    except Exception as e:
+                        failures.append((f'{rec["email"]} month {month+1}', e))
+                        continue
+                    summary['upgrades'] += upgraded
+                    summary['invoices_paid'] += paid
+                    rec['months_done'] = month + 1
+                    created_fh.write(json.dumps(rec) + '\n')
 
-    # summary and persist
     print('\nSummary:')
     for k, v in summary.items():
         print(f'- {k}: {v}')
-
-    try:
-        import json
-        with open('generated_upgrade_customers.json', 'w', encoding='utf-8') as fh:
-            json.dump(created, fh, indent=2)
-        print(f"Wrote {len(created)} created customers to generated_upgrade_customers.json")
-    except Exception:
-        pass
+    if failures:
+        print(f'\n{len(failures)} failure(s); rerun with --resume to retry them:')
+        for what, e in failures:
+            print(f'  - {what}: {e}')
 
     print('\nDone. Inspect the Stripe Dashboard (test mode) to verify customers, subscriptions, and invoices.')
 
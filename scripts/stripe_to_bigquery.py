@@ -19,25 +19,141 @@ Env required:
 from __future__ import annotations
 
 import argparse
+import functools
 import os
+import random
 import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+import requests
 import stripe
 from google.cloud import bigquery
 
 
-# Be gentle to Stripe API
-SLEEP_SECONDS = 0.05
-SLEEP_EVERY_N = 80
+# Customers fetched in parallel (each worker issues its own subscription + invoice listings)
+DEFAULT_CONCURRENCY = 16
+
+
+class AIMDLimiter:
+    """Caps in-flight Stripe requests with an additive-increase / multiplicative-decrease window.
+
+    Each success grows the window by `alpha / limit` (about +alpha per full window of requests);
+    each 429/5xx multiplies it by `beta`. Callers block in acquire() while the window is full.
+    """
+
+    def __init__(self, initial: float = 8.0, min_limit: float = 1.0, max_limit: float = 64.0,
+                 alpha: float = 0.5, beta: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.alpha = alpha
+        self.beta = beta
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.beta)
+            else:
+                self.limit = min(self.max_limit, self.limit + self.alpha / self.limit)
+            self._cond.notify_all()
+
+
+# Be gentle to Stripe API: adapt concurrency to 429s instead of sleeping on a fixed schedule
+LIMITER = AIMDLimiter()
+CALL_MAX_ATTEMPTS = 5
+BACKOFF_CAP = 30.0
+
+
+def _is_throttle(e: Exception) -> bool:
+    if isinstance(e, stripe.error.RateLimitError):
+        return True
+    status = getattr(e, "http_status", None)
+    return isinstance(e, stripe.error.StripeError) and status is not None and status >= 500
+
+
+def _retry_delay(e: Exception, attempt: int) -> float:
+    """Server's Retry-After when present, else full jitter: uniform(0, min(2**attempt, BACKOFF_CAP))."""
+    headers = getattr(e, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        if value is not None:
+            return float(value) + random.uniform(0, 0.25)
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(0, min(2 ** attempt, BACKOFF_CAP))
+
+
+def call(fn, *args, **kwargs):
+    """
+    Invoke a Stripe SDK function through the shared AIMD limiter.
+    429/5xx shrink the window and are retried with backoff unless Stripe says not to
+    (Stripe-Should-Retry: false); other errors are raised unchanged.
+    """
+    for attempt in range(CALL_MAX_ATTEMPTS):
+        LIMITER.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            throttled = _is_throttle(e)
+            LIMITER.release(throttled=throttled)
+            headers = getattr(e, "headers", None) or {}
+            if not throttled or attempt == CALL_MAX_ATTEMPTS - 1 or headers.get("Stripe-Should-Retry") == "false":
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            continue
+        LIMITER.release()
+        return result
+
+
+def configure_http_client(pool_maxsize: int) -> None:
+    """One pooled keep-alive requests.Session for every Stripe call, shared by all worker threads."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=30, session=session)
+
+
+def list_all(fn, **params) -> List[Dict[str, Any]]:
+    """
+    Drain a Stripe list or search endpoint with an explicit cursor (starting_after for lists,
+    next_page for search). Each page is its own call(), so a throttled page is retried alone
+    instead of re-running the whole listing.
+    """
+    out: List[Dict[str, Any]] = []
+    while True:
+        page = call(fn, **params)
+        data = page.get("data") or []
+        out.extend(data)
+        if not page.get("has_more") or not data:
+            return out
+        if page.get("next_page"):
+            params = {**params, "page": page["next_page"]}
+        else:
+            params = {**params, "starting_after": data[-1]["id"]}
+
+
+@functools.lru_cache(maxsize=65536)
+def _iso_utc(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
 
 
 def iso(ts: Optional[int]) -> Optional[str]:
-    if ts is None:
-        return None
-    return datetime.fromtimestamp(int(ts), tz=timezone.utc).isoformat()
+    # Timestamps repeat a lot across rows (period bounds, paid_at), so conversions are cached
+    return _iso_utc(int(ts)) if ts is not None else None
 
 
 def get_stripe_key() -> str:
@@ -47,19 +163,9 @@ def get_stripe_key() -> str:
     return k
 
 
-def safe_get(d: Any, *keys, default=None):
-    cur = d
-    for k in keys:
-        if cur is None:
-            return default
-        if isinstance(cur, dict):
-            cur = cur.get(k)
-        else:
-            try:
-                cur = getattr(cur, k)
-            except Exception:
-                return default
-    return default if cur is None else cur
+def _dict_or_empty(v: Any) -> Dict[str, Any]:
+    """v if it is a mapping (StripeObject subclasses dict), else {} -- e.g. for an unexpanded id string."""
+    return v if isinstance(v, dict) else {}
 
 
 # -----------------------
@@ -105,51 +211,339 @@ def load_rows_truncate(
     return job.output_rows
 
 
+def invoice_watermarks(bq: bigquery.Client, project_id: str, dataset_id: str) -> Dict[str, int]:
+    """customer_id -> newest already-loaded invoice creation time (epoch seconds), for --incremental."""
+    sql = (
+        "SELECT customer_id, UNIX_SECONDS(MAX(created_ts)) AS hw "
+        f"FROM `{project_id}.{dataset_id}.stripe_invoices` "
+        "WHERE customer_id IS NOT NULL AND created_ts IS NOT NULL GROUP BY customer_id"
+    )
+    return {r["customer_id"]: int(r["hw"]) for r in bq.query(sql).result()}
+
+
+def upsert_rows(
+    bq: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    table_name: str,
+    schema: List[bigquery.SchemaField],
+    rows: List[Dict[str, Any]],
+    key: str,
+) -> int:
+    """
+    --incremental: load rows into a staging table, then in one transaction delete the target rows
+    whose `key` is being reloaded and insert the staged ones. Delete+insert rather than MERGE
+    so a key spread over several rows (e.g. one per subscription item) is replaced as a whole.
+    """
+    if not rows:
+        return 0
+
+    table_id = f"{project_id}.{dataset_id}.{table_name}"
+    staging_id = f"{table_id}_staging"
+    job_config = bigquery.LoadJobConfig(schema=schema, write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    bq.load_table_from_json(rows, staging_id, job_config=job_config).result()
+
+    cols = ", ".join(f.name for f in schema)
+    sql = (
+        "BEGIN TRANSACTION;\n"
+        f"DELETE FROM `{table_id}` WHERE {key} IN (SELECT {key} FROM `{staging_id}`);\n"
+        f"INSERT INTO `{table_id}` ({cols}) SELECT {cols} FROM `{staging_id}`;\n"
+        "COMMIT TRANSACTION;"
+    )
+    try:
+        bq.query(sql).result()
+    finally:
+        bq.delete_table(staging_id, not_found_ok=True)
+    return len(rows)
+
+
+# Streaming (--load_mode stream): one key column per table, used to build insertAll row ids
+TABLE_KEYS = {
+    "stripe_customers": "customer_id",
+    "stripe_subscriptions": "subscription_id",
+    "stripe_invoices": "invoice_id",
+}
+STREAM_BATCH_ROWS = 500
+
+
+def truncate_tables(bq: bigquery.Client, project_id: str, dataset_id: str, table_names: List[str]):
+    """TRUNCATE several tables with one multi-statement query job instead of one job each."""
+    sql = "\n".join(f"TRUNCATE TABLE `{project_id}.{dataset_id}.{t}`;" for t in table_names)
+    bq.query(sql).result()
+
+
+def stream_rows(
+    bq: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    table_name: str,
+    rows: List[Dict[str, Any]],
+) -> int:
+    """
+    Append rows via tabledata.insertAll (no load-job queueing), in STREAM_BATCH_ROWS batches.
+    Row ids are "<key>:<n-th row with that key>", so a retried batch is de-duplicated by BigQuery.
+    Caller truncates first (see truncate_tables / StreamSink).
+    """
+    table_id = f"{project_id}.{dataset_id}.{table_name}"
+    key = TABLE_KEYS[table_name]
+    seen: Counter = Counter()
+    row_ids: List[str] = []
+    for r in rows:
+        k = r.get(key)
+        row_ids.append(f"{k}:{seen[k]}")
+        seen[k] += 1
+
+    for i in range(0, len(rows), STREAM_BATCH_ROWS):
+        errors = bq.insert_rows_json(table_id, rows[i:i + STREAM_BATCH_ROWS], row_ids=row_ids[i:i + STREAM_BATCH_ROWS])
+        if errors:
+            raise RuntimeError(f"insertAll into {table_id} failed: {errors[:3]}")
+    return len(rows)
+
+
+class StreamSink:
+    """
+    --load_mode stream: append rows to BigQuery while Stripe is still being read.
+
+    Rows are buffered per table and handed to stream_rows() on a small thread pool whenever a
+    buffer reaches STREAM_BATCH_ROWS, so inserts overlap with the Stripe fetches instead of
+    waiting for them. Add all rows sharing a key in one add() call (row ids count rows per key).
+    The tables are truncated (one script) just before the first batch is sent, or at close() if
+    none was, so a fetch that fails before any buffer fills leaves the old contents in place.
+    """
+
+    def __init__(self, bq: bigquery.Client, project_id: str, dataset_id: str, workers: int = 3):
+        self.bq = bq
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self._ex = ThreadPoolExecutor(max_workers=workers)
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {t: [] for t in TABLE_KEYS}
+        self._futures: List[Tuple[str, Any]] = []
+        self._truncated = False
+
+    def _truncate_once(self) -> None:
+        if not self._truncated:
+            truncate_tables(self.bq, self.project_id, self.dataset_id, list(TABLE_KEYS))
+            self._truncated = True
+
+    def add(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        buf = self._buffers[table_name]
+        buf.extend(rows)
+        if len(buf) >= STREAM_BATCH_ROWS:
+            self._flush(table_name)
+
+    def _flush(self, table_name: str) -> None:
+        rows, self._buffers[table_name] = self._buffers[table_name], []
+        if rows:
+            self._truncate_once()
+            fut = self._ex.submit(stream_rows, self.bq, self.project_id, self.dataset_id, table_name, rows)
+            self._futures.append((table_name, fut))
+
+    def close(self) -> Dict[str, int]:
+        """Flush what is left, wait for every insert (re-raising the first error); rows written per table."""
+        self._truncate_once()
+        for t in self._buffers:
+            self._flush(t)
+        written = {t: 0 for t in TABLE_KEYS}
+        try:
+            for t, fut in self._futures:
+                written[t] += fut.result()
+        finally:
+            self._ex.shutdown(wait=True)
+        return written
+
+    def abort(self) -> None:
+        """Drop queued batches (after a fetch failure); inserts already running finish."""
+        self._ex.shutdown(wait=False, cancel_futures=True)
+
+
+# Storage Write API (--load_mode storage): optional google-cloud-bigquery-storage dependency
+STORAGE_BATCH_ROWS = 1000
+
+
+def _storage_row_class(table_name: str, schema: List[bigquery.SchemaField]):
+    """Build a proto2 message class whose fields mirror the table schema (all optional => NULL-able)."""
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+    F = descriptor_pb2.FieldDescriptorProto
+    proto_types = {
+        "STRING": F.TYPE_STRING,
+        "INTEGER": F.TYPE_INT64,
+        "TIMESTAMP": F.TYPE_INT64,  # microseconds since epoch
+        "BOOL": F.TYPE_BOOL,
+    }
+    file_proto = descriptor_pb2.FileDescriptorProto(name=f"{table_name}.proto", package="stripe_etl", syntax="proto2")
+    msg = file_proto.message_type.add(name=table_name)
+    for number, field in enumerate(schema, start=1):
+        msg.field.add(name=field.name, number=number, type=proto_types[field.field_type], label=F.LABEL_OPTIONAL)
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    desc = pool.FindMessageTypeByName(f"stripe_etl.{table_name}")
+    try:
+        return message_factory.GetMessageClass(desc)
+    except AttributeError:  # protobuf < 4.21
+        return message_factory.MessageFactory(pool).GetPrototype(desc)
+
+
+def _storage_value(field: bigquery.SchemaField, v: Any) -> Any:
+    if field.field_type == "TIMESTAMP":
+        return int(datetime.fromisoformat(v).timestamp() * 1_000_000)
+    return v
+
+
+def storage_write_replace(
+    bq: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    table_name: str,
+    schema: List[bigquery.SchemaField],
+    rows: List[Dict[str, Any]],
+) -> int:
+    """
+    Replace a table's contents through the BigQuery Storage Write API: append protobuf-encoded
+    rows to a PENDING stream in STORAGE_BATCH_ROWS batches (with offsets, so a retried append is
+    not duplicated) and finalize it, then TRUNCATE and commit the stream back to back, making all
+    rows visible at once. Nothing is truncated unless every row reached the finalized stream, so
+    a failed append or finalize leaves the previous contents in place.
+    """
+    try:
+        from google.cloud import bigquery_storage_v1
+        from google.cloud.bigquery_storage_v1 import types, writer
+        from google.protobuf import descriptor_pb2
+    except ImportError as e:
+        raise RuntimeError("--load_mode storage needs: pip install google-cloud-bigquery-storage") from e
+
+    if not rows:
+        truncate_table(bq, project_id, dataset_id, table_name)
+        return 0
+
+    row_cls = _storage_row_class(table_name, schema)
+    write_client = bigquery_storage_v1.BigQueryWriteClient()
+    parent = write_client.table_path(project_id, dataset_id, table_name)
+    stream = write_client.create_write_stream(
+        parent=parent, write_stream=types.WriteStream(type_=types.WriteStream.Type.PENDING)
+    )
+
+    template = types.AppendRowsRequest(write_stream=stream.name)
+    proto_descriptor = descriptor_pb2.DescriptorProto()
+    row_cls.DESCRIPTOR.CopyToProto(proto_descriptor)
+    template.proto_rows = types.AppendRowsRequest.ProtoData(
+        writer_schema=types.ProtoSchema(proto_descriptor=proto_descriptor)
+    )
+    append_stream = writer.AppendRowsStream(write_client, template)
+
+    try:
+        futures = []
+        for offset in range(0, len(rows), STORAGE_BATCH_ROWS):
+            proto_rows = types.ProtoRows()
+            for r in rows[offset:offset + STORAGE_BATCH_ROWS]:
+                msg = row_cls(**{f.name: _storage_value(f, r[f.name]) for f in schema if r.get(f.name) is not None})
+                proto_rows.serialized_rows.append(msg.SerializeToString())
+            request = types.AppendRowsRequest(
+                offset=offset, proto_rows=types.AppendRowsRequest.ProtoData(rows=proto_rows)
+            )
+            futures.append(append_stream.send(request))
+        for fut in futures:
+            fut.result()
+    finally:
+        append_stream.close()
+
+    finalized = write_client.finalize_write_stream(name=stream.name)
+    if finalized.row_count != len(rows):
+        raise RuntimeError(
+            f"Storage Write stream for {table_name} holds {finalized.row_count} of {len(rows)} rows; "
+            "table left untouched"
+        )
+
+    truncate_table(bq, project_id, dataset_id, table_name)
+    commit = write_client.batch_commit_write_streams(
+        types.BatchCommitWriteStreamsRequest(parent=parent, write_streams=[stream.name])
+    )
+    if commit.stream_errors:
+        raise RuntimeError(
+            f"Storage Write commit to {table_name} failed after TRUNCATE (rerun to reload it): "
+            f"{list(commit.stream_errors)[:3]}"
+        )
+    return len(rows)
+
+
 # -----------------------
 # Stripe fetch
 # -----------------------
 def fetch_customers_via_search(query: str) -> List[Dict[str, Any]]:
-    customers: List[Dict[str, Any]] = []
-    i = 0
-    for c in stripe.Customer.search(query=query, limit=100).auto_paging_iter():
-        customers.append(c)
-        i += 1
-        if i % SLEEP_EVERY_N == 0:
-            time.sleep(SLEEP_SECONDS)
-    return customers
+    # Embed each customer's (non-canceled) subscriptions; their items carry the full price object
+    return list_all(stripe.Customer.search, query=query, limit=100, expand=["data.subscriptions"])
 
 
 def fetch_subscriptions_for_customer(customer_id: str) -> List[Dict[str, Any]]:
     # Expand price so we can read unit_amount/interval without extra calls
-    subs: List[Dict[str, Any]] = []
-    i = 0
-    for s in stripe.Subscription.list(
+    return list_all(
+        stripe.Subscription.list,
         customer=customer_id,
         status="all",
         limit=100,
         expand=["data.items.data.price"],
-    ).auto_paging_iter():
-        subs.append(s)
-        i += 1
-        if i % SLEEP_EVERY_N == 0:
-            time.sleep(SLEEP_SECONDS)
-    return subs
+    )
 
 
-def fetch_invoices_for_customer(customer_id: str) -> List[Dict[str, Any]]:
+def fetch_invoices_for_customer(customer_id: str, created_gte: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     IMPORTANT FIX:
     - Since invoices are manually created, invoice.subscription is often NULL.
     - So we must list invoices by customer, not by subscription.
+
+    invoice.subscription is expanded so subscription-backed invoices carry their
+    subscription (items + price included) and need no separate Subscription.list.
+    created_gte (--incremental) limits the listing to invoices created at or after that time.
+    """
+    params: Dict[str, Any] = {"customer": customer_id, "limit": 100, "expand": ["data.subscription"]}
+    if created_gte is not None:
+        params["created"] = {"gte": created_gte}
+    return list_all(stripe.Invoice.list, **params)
+
+
+def subscriptions_from_invoices(invs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Distinct expanded subscriptions referenced by a customer's invoices, first seen first."""
+    subs: Dict[str, Dict[str, Any]] = {}
+    for inv in invs:
+        sub = inv.get("subscription")
+        if sub is not None and not isinstance(sub, str) and sub.get("id") not in subs:
+            subs[sub.get("id")] = sub
+    return list(subs.values())
+
+
+def fetch_customer_children(
+    customer: Dict[str, Any],
+    invoices_since: Optional[int] = None,
+    list_subscriptions: bool = False,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Subscriptions and invoices for one customer; independent of every other customer.
+    Subscriptions come from the invoices' expanded subscription plus the ones embedded by
+    the search (expand=data.subscriptions). Subscription.list is only needed when the embedded
+    list is truncated, for a delinquent customer with nothing embedded (its subscription
+    may already be canceled, and canceled ones are not embedded), or when neither source
+    produced anything (a canceled subscription with no invoices is only visible to list).
+    list_subscriptions (--incremental) always lists them: the invoices since the watermark
+    no longer cover every subscription, so the derived set would miss cancellations.
     """
-    invs: List[Dict[str, Any]] = []
-    i = 0
-    for inv in stripe.Invoice.list(customer=customer_id, limit=100).auto_paging_iter():
-        invs.append(inv)
-        i += 1
-        if i % SLEEP_EVERY_N == 0:
-            time.sleep(SLEEP_SECONDS)
-    return invs
+    customer_id = customer.get("id")
+    invs = fetch_invoices_for_customer(customer_id, created_gte=invoices_since)
+    if list_subscriptions:
+        return fetch_subscriptions_for_customer(customer_id), invs
+
+    embedded = customer.get("subscriptions")
+    embedded = embedded if isinstance(embedded, dict) else {}
+    if embedded.get("has_more") or (not embedded.get("data") and customer.get("delinquent")):
+        return fetch_subscriptions_for_customer(customer_id), invs
+
+    subs = subscriptions_from_invoices(invs)
+    seen = {sub.get("id") for sub in subs}
+    subs.extend(sub for sub in embedded.get("data") or [] if sub.get("id") not in seen)
+    if not subs:
+        # nothing from invoices or the embedded list: list(status=all) as before
+        subs = fetch_subscriptions_for_customer(customer_id)
+    return subs, invs
 
 
 # -----------------------
@@ -170,30 +564,30 @@ def subscription_item_rows(sub: Dict[str, Any]) -> List[Dict[str, Any]]:
     - write 1 row per subscription item (usually 1)
     """
     rows: List[Dict[str, Any]] = []
-    sid = sub.get("id")
-    cid = sub.get("customer")
-
-    items = safe_get(sub, "items", "data", default=[]) or []
-    if not items:
-        items = [None]
+    items = _dict_or_empty(sub.get("items")).get("data") or [None]
+
+    # subscription-level columns are the same for every item: build them once
+    base = {
+        "subscription_id": sub.get("id"),
+        "customer_id": sub.get("customer"),
+        "status": sub.get("status"),
+        "created_ts": iso(sub.get("created")),
+        "current_period_start_ts": iso(sub.get("current_period_start")),
+        "current_period_end_ts": iso(sub.get("current_period_end")),
+        "canceled_at_ts": iso(sub.get("canceled_at")),
+        "cancel_at_period_end": bool(sub.get("cancel_at_period_end") or False),
+    }
 
     for it in items:
-        price = safe_get(it, "price", default={}) or {}
-        recurring = safe_get(price, "recurring", default={}) or {}
-        unit_amount = safe_get(price, "unit_amount", default=None)
-        interval = safe_get(recurring, "interval", default=None)
-        currency = safe_get(price, "currency", default=None)
-        qty = safe_get(it, "quantity", default=1)
+        it = _dict_or_empty(it)
+        price = _dict_or_empty(it.get("price"))
+        unit_amount = price.get("unit_amount")
+        interval = _dict_or_empty(price.get("recurring")).get("interval")
+        currency = price.get("currency")
+        qty = it.get("quantity")
 
         rows.append({
-            "subscription_id": sid,
-            "customer_id": cid,
-            "status": sub.get("status"),
-            "created_ts": iso(sub.get("created")),
-            "current_period_start_ts": iso(sub.get("current_period_start")),
-            "current_period_end_ts": iso(sub.get("current_period_end")),
-            "canceled_at_ts": iso(sub.get("canceled_at")),
-            "cancel_at_period_end": bool(sub.get("cancel_at_period_end") or False),
+            **base,
             "price_amount": int(unit_amount) if unit_amount is not None else None,  # cents
             "price_interval": interval,  # month/year
             "currency": currency,
@@ -208,8 +602,9 @@ def invoice_row(inv: Dict[str, Any], filled_subscription_id: Optional[str]) -> D
     - If Stripe invoice already has subscription => keep it
     - Else use the customer->subscription mapping (your confirmed 1:1)
     """
-    paid_at = safe_get(inv, "status_transitions", "paid_at", default=None)
-    raw_sub_id = inv.get("subscription")
+    paid_at = _dict_or_empty(inv.get("status_transitions")).get("paid_at")
+    raw_sub = inv.get("subscription")  # id, or the subscription itself when expanded
+    raw_sub_id = raw_sub if raw_sub is None or isinstance(raw_sub, str) else raw_sub.get("id")
     final_sub_id = raw_sub_id if raw_sub_id else filled_subscription_id
 
     return {
@@ -235,9 +630,29 @@ def main():
     parser.add_argument("--project_id", required=True)
     parser.add_argument("--dataset", required=True)
     parser.add_argument("--customer_search_query", default="created>=0")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Customers whose subscriptions/invoices are fetched in parallel")
+    parser.add_argument("--load_mode", choices=["load", "stream", "storage"], default="load",
+                        help="load: WRITE_TRUNCATE load jobs (default). stream: concurrent insertAll "
+                             "while Stripe is read, after one TRUNCATE script right before the first insert; much lower latency for small imports, but a re-run "
+                             "within ~90 min can be refused while rows sit in the streaming buffer, and a "
+                             "run that fails once inserts have started leaves the tables partly loaded. "
+                             "storage: Storage Write API (needs google-cloud-bigquery-storage); rows are "
+                             "appended to a PENDING stream and finalized, then the table is truncated and the "
+                             "stream committed. A failure in the short window between TRUNCATE and commit "
+                             "leaves the table empty; rerun to reload it.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch invoices created since each customer's newest loaded invoice and "
+                             "upsert invoices instead of replacing them (load mode only). Older invoices are "
+                             "not re-read, so their later status changes are missed. Subscriptions are still "
+                             "listed in full (status=all) per customer and replace stripe_subscriptions, so "
+                             "cancellations since the last run are picked up.")
     args = parser.parse_args()
+    if args.incremental and args.load_mode != "load":
+        parser.error("--incremental works with --load_mode load only")
 
     stripe.api_key = get_stripe_key()
+    configure_http_client(pool_maxsize=max(args.concurrency, int(LIMITER.max_limit)))
     bq = bigquery.Client(project=args.project_id)
     ds_ref = ensure_dataset(bq, args.project_id, args.dataset)
 
@@ -287,59 +702,115 @@ def main():
     print(f"Customers found via search: {len(customers)}")
 
     customer_rows = [customer_row(c) for c in customers]
-    customer_ids: List[str] = [c.get("id") for c in customers if c.get("id")]
-
-    # 2) Subscriptions + build customer->subscription mapping (your confirmed 1:1)
+    with_id = [c for c in customers if c.get("id")]
+    customer_ids: List[str] = [c.get("id") for c in with_id]
+
+    watermarks: Dict[str, int] = {}
+    if args.incremental:
+        watermarks = invoice_watermarks(bq, args.project_id, args.dataset)
+        print(f"Incremental: {len(watermarks)} customers already have invoices loaded")
+
+    def fetch_children(c: Dict[str, Any]):
+        # >= the watermark (not >): invoices created in the same second are re-read and upserted
+        return fetch_customer_children(
+            c, invoices_since=watermarks.get(c.get("id")), list_subscriptions=args.incremental
+        )
+
+    # stream mode inserts batches as they fill (truncating right before the first one); load mode
+    # keeps every row for one WRITE_TRUNCATE load job per table at the end
+    sink: Optional[StreamSink] = None
+    if args.load_mode == "stream":
+        sink = StreamSink(bq, args.project_id, args.dataset)
     sub_rows: List[Dict[str, Any]] = []
-    cust_to_sub: Dict[str, str] = {}  # customer_id -> subscription_id
-
-    for idx, cid in enumerate(customer_ids, start=1):
-        subs = fetch_subscriptions_for_customer(cid)
-
-        # Your assumption: exactly 1 subscription per customer.
-        # We still code defensively: if 0 => mapping missing; if >1 => take the most recently created.
-        if subs:
-            subs_sorted = sorted(subs, key=lambda s: int(s.get("created") or 0), reverse=True)
-            chosen = subs_sorted[0]
-            sid = chosen.get("id")
-            if sid:
-                cust_to_sub[cid] = sid
-
-            # load all subscription item rows (still fine)
-            for s in subs:
-                sub_rows.extend(subscription_item_rows(s))
-
-        if idx % SLEEP_EVERY_N == 0:
-            time.sleep(SLEEP_SECONDS)
-
-    print(f"Subscription rows prepared: {len(sub_rows)}")
-    print(f"Customer->Subscription mappings built: {len(cust_to_sub)}")
+    inv_rows: List[Dict[str, Any]] = []
+    n_sub_rows = 0
+    n_inv_rows = 0
 
+    # 2) Subscriptions + build customer->subscription mapping (your confirmed 1:1)
     # 3) Invoices by customer (NOT subscription), fill subscription_id using mapping
-    inv_rows: List[Dict[str, Any]] = []
+    cust_to_sub: Dict[str, str] = {}  # customer_id -> subscription_id
     inv_seen: Set[str] = set()
 
-    for j, cid in enumerate(customer_ids, start=1):
-        invs = fetch_invoices_for_customer(cid)
-        fill_sid = cust_to_sub.get(cid)
-
-        for inv in invs:
-            iid = inv.get("id")
-            if not iid or iid in inv_seen:
-                continue
-            inv_seen.add(iid)
-
-            inv_rows.append(invoice_row(inv, filled_subscription_id=fill_sid))
-
-        if j % SLEEP_EVERY_N == 0:
-            time.sleep(SLEEP_SECONDS)
-
-    print(f"Invoice rows prepared: {len(inv_rows)}")
+    # Fetch every customer's subscriptions + invoices concurrently; the round-trips are pure
+    # network wait. map() yields in customer order as results arrive, so rows are built (and in
+    # stream mode inserted) while later customers are still being fetched.
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+            for cid, (subs, invs) in zip(customer_ids, ex.map(fetch_children, with_id)):
+                cust_sub_rows: List[Dict[str, Any]] = []
+
+                # Your assumption: exactly 1 subscription per customer.
+                # We still code defensively: if 0 => mapping missing; if >1 => take the most recently created.
+                if subs:
+                    subs_sorted = sorted(subs, key=lambda s: int(s.get("created") or 0), reverse=True)
+                    chosen = subs_sorted[0]
+                    sid = chosen.get("id")
+                    if sid:
+                        cust_to_sub[cid] = sid
+
+                    # load all subscription item rows (still fine)
+                    for s in subs:
+                        cust_sub_rows.extend(subscription_item_rows(s))
+
+                fill_sid = cust_to_sub.get(cid)
+                cust_inv_rows: List[Dict[str, Any]] = []
+                for inv in invs:
+                    iid = inv.get("id")
+                    if not iid or iid in inv_seen:
+                        continue
+                    inv_seen.add(iid)
+
+                    cust_inv_rows.append(invoice_row(inv, filled_subscription_id=fill_sid))
+
+                n_sub_rows += len(cust_sub_rows)
+                n_inv_rows += len(cust_inv_rows)
+                if sink:
+                    sink.add("stripe_subscriptions", cust_sub_rows)
+                    sink.add("stripe_invoices", cust_inv_rows)
+                else:
+                    sub_rows.extend(cust_sub_rows)
+                    inv_rows.extend(cust_inv_rows)
+    except BaseException:
+        if sink:
+            sink.abort()
+        raise
+
+    print(f"Subscription rows prepared: {n_sub_rows}")
+    print(f"Customer->Subscription mappings built: {len(cust_to_sub)}")
+    print(f"Invoice rows prepared: {n_inv_rows}")
 
     # 4) Load (truncate then replace). Handle empty safely.
-    out_c = load_rows_truncate(bq, args.project_id, args.dataset, "stripe_customers", customer_rows)
-    out_s = load_rows_truncate(bq, args.project_id, args.dataset, "stripe_subscriptions", sub_rows)
-    out_i = load_rows_truncate(bq, args.project_id, args.dataset, "stripe_invoices", inv_rows)
+    if sink:
+        # customers are known up front, but adding them last keeps them from triggering the
+        # TRUNCATE before a single subscription/invoice fetch has succeeded
+        sink.add("stripe_customers", customer_rows)
+        written = sink.close()
+        out_c, out_s, out_i = (written[t] for t in ("stripe_customers", "stripe_subscriptions", "stripe_invoices"))
+    else:
+        # The three tables are independent: run their load jobs / writes side by side and wait
+        # for all of them, instead of blocking on each job in turn
+        project, dataset = args.project_id, args.dataset
+        if args.incremental:
+            loads = [
+                functools.partial(load_rows_truncate, bq, project, dataset, "stripe_customers", customer_rows),
+                functools.partial(load_rows_truncate, bq, project, dataset, "stripe_subscriptions", sub_rows),
+                functools.partial(upsert_rows, bq, project, dataset, "stripe_invoices", inv_schema, inv_rows, "invoice_id"),
+            ]
+        elif args.load_mode == "storage":
+            loads = [
+                functools.partial(storage_write_replace, bq, project, dataset, "stripe_customers", customers_schema, customer_rows),
+                functools.partial(storage_write_replace, bq, project, dataset, "stripe_subscriptions", subs_schema, sub_rows),
+                functools.partial(storage_write_replace, bq, project, dataset, "stripe_invoices", inv_schema, inv_rows),
+            ]
+        else:
+            loads = [
+                functools.partial(load_rows_truncate, bq, project, dataset, "stripe_customers", customer_rows),
+                functools.partial(load_rows_truncate, bq, project, dataset, "stripe_subscriptions", sub_rows),
+                functools.partial(load_rows_truncate, bq, project, dataset, "stripe_invoices", inv_rows),
+            ]
+        with ThreadPoolExecutor(max_workers=len(loads)) as ex:
+            futures = [ex.submit(fn) for fn in loads]
+            out_c, out_s, out_i = [f.result() for f in futures]
 
     print(f"Loaded rows -> customers: {out_c}, subscriptions: {out_s}, invoices: {out_i}")
     print("Done.")